@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends whose entries are not visible to other processes
+_PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_pin_cache(app_configs, **kwargs):
+    """Replica reads need a shared cache for read-your-writes pins.
+
+    Pins are set by web requests and by Celery workers when a task completes
+    (core.db_routers.pin_to_primary); with a per-process cache the process
+    serving the next read never sees them and clients read stale replicas.
+    """
+    if not getattr(settings, 'WEATHER_READ_REPLICAS', []):
+        return []
+
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend not in _PROCESS_LOCAL_CACHES:
+        return []
+
+    return [Error(
+        'WEATHER_READ_REPLICAS is set but the default cache is process-local.',
+        hint='Set CACHE_URL to a shared cache (e.g. Redis or Memcached) so '
+             'primary pins are visible to every web and worker process, or '
+             'disable replica reads.',
+        obj=backend,
+        id='core.E001',
+    )]
@@ -0,0 +1,58 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+# The replica serving reads in the current context, or None for the primary.
+# Only set around safe web requests (core.middleware.ReplicaReadMiddleware),
+# so Celery tasks and writes always see the primary.
+_replica_alias = ContextVar('replica_alias', default=None)
+
+
+@contextmanager
+def replica_reads():
+    """Serve reads in this context from one replica chosen up front, so all
+    queries of a request (e.g. a list and its prefetches) see the same lag"""
+    replicas = getattr(settings, 'WEATHER_READ_REPLICAS', [])
+    token = _replica_alias.set(random.choice(replicas) if replicas else None)
+    try:
+        yield
+    finally:
+        _replica_alias.reset(token)
+
+
+def _pin_key(client_ip):
+    return f'weather:primary-pin:{client_ip}'
+
+
+def pin_to_primary(client_ip):
+    """Serve ``client_ip``'s reads from the primary for a short while.
+
+    Called after a client submits a request and after its task completes, so
+    the client reads its own writes even if the replicas lag behind.
+    """
+    if client_ip:
+        cache.set(_pin_key(client_ip), True,
+                  timeout=getattr(settings, 'WEATHER_REPLICA_PIN_SECONDS', 10))
+
+
+def is_pinned_to_primary(client_ip):
+    return bool(client_ip) and cache.get(_pin_key(client_ip), False)
+
+
+class ReadReplicaRouter:
+    """Send reads to the replica chosen by replica_reads() while it is active"""
+
+    def db_for_read(self, model, **hints):
+        return _replica_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Read-your-writes: anything after a write in this context uses the primary
+        _replica_alias.set(None)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
@@ -0,0 +1,51 @@
+import csv
+import json
+
+from django.conf import settings
+
+EXPORT_FIELDS = ['id', 'request_id', 'city', 'temperature',
+                 'wind_kph', 'humidity', 'last_updated']
+
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """File-like object whose write() just hands the line back to csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset):
+    """Yield export rows as tuples over a server-side cursor"""
+    chunk_size = getattr(settings, 'WEATHER_EXPORT_CHUNK_SIZE', 2000)
+    return queryset.order_by('id').values_list(
+        *EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def _format_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def stream_ndjson(queryset):
+    for row in iter_rows(queryset):
+        record = dict(zip(EXPORT_FIELDS, map(_format_value, row)))
+        yield json.dumps(record) + '\n'
+
+
+def stream_csv(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in iter_rows(queryset):
+        yield writer.writerow([_format_value(value) for value in row])
+
+
+STREAMERS = {
+    'ndjson': stream_ndjson,
+    'csv': stream_csv,
+}
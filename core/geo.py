@@ -0,0 +1,68 @@
+import math
+import threading
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Location
+from .utils import normalize_city
+
+
+class LocationIndex:
+    """In-memory gazetteer lookup: normalized city name -> (latitude, longitude).
+
+    Loaded from the Location table on first use and dropped whenever a
+    Location is saved or deleted in this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+
+    def resolve(self, city):
+        with self._lock:
+            if self._index is None:
+                self._index = {
+                    name: (latitude, longitude)
+                    for name, latitude, longitude in Location.objects.values_list(
+                        'normalized_name', 'latitude', 'longitude').iterator()
+                }
+            return self._index.get(normalize_city(city))
+
+
+location_index = LocationIndex()
+
+
+@receiver([post_save, post_delete], sender=Location)
+def _reset_location_index(**kwargs):
+    location_index.reset()
+
+
+def grid_cell(latitude, longitude, size):
+    return (math.floor(latitude / size), math.floor(longitude / size))
+
+
+def group_cities(cities):
+    """Group cities that can share one upstream fetch.
+
+    Returns ``(city, coordinates, [cities])`` tuples in request order, where
+    ``city`` is the group's first name. Cities resolved through the gazetteer
+    share a group when their coordinates fall in the same
+    WEATHER_GRID_CELL_DEGREES cell and carry those coordinates; unresolved
+    cities are grouped by normalized name with ``coordinates`` None.
+    """
+    size = getattr(settings, 'WEATHER_GRID_CELL_DEGREES', 0.1)
+    groups = {}
+    for city in cities:
+        coordinates = location_index.resolve(city) if size > 0 else None
+        if coordinates is None:
+            key = ('name', normalize_city(city))
+        else:
+            key = ('cell', grid_cell(*coordinates, size))
+        groups.setdefault(key, (city, coordinates, []))[2].append(city)
+    return list(groups.values())
@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import requests
+from django.conf import settings
+
+
+class LatencyTracker:
+    """Rolling window of recent upstream response times (seconds)"""
+
+    def __init__(self, size=200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, min_samples=1):
+        """Return the ``pct`` percentile latency, or None with too few samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(int(len(samples) * pct / 100), len(samples) - 1)
+        return samples[index]
+
+
+upstream_latency = LatencyTracker()
+
+_hedge_slots = None
+_hedge_slots_lock = threading.Lock()
+
+
+def _get_hedge_slots():
+    """Semaphore capping concurrent hedges at WEATHER_HEDGE_MAX_WORKERS"""
+    global _hedge_slots
+    size = getattr(settings, 'WEATHER_HEDGE_MAX_WORKERS', 8)
+    with _hedge_slots_lock:
+        if _hedge_slots is None or _hedge_slots[0] != size:
+            _hedge_slots = (size, threading.BoundedSemaphore(size))
+        return _hedge_slots[1]
+
+
+def _timed_get(url, timeout, tracker):
+    start = time.monotonic()
+    response = requests.get(url, timeout=timeout)
+    tracker.record(time.monotonic() - start)
+    return response
+
+
+def _start_get(url, timeout, tracker, results, release=None):
+    """Run _timed_get on a new thread, putting (ok, response or error) on results"""
+    def run():
+        try:
+            results.put((True, _timed_get(url, timeout, tracker)))
+        except Exception as e:
+            results.put((False, e))
+        finally:
+            if release is not None:
+                release()
+
+    threading.Thread(target=run, name='weather-hedge', daemon=True).start()
+
+
+def hedge_delay(tracker=upstream_latency):
+    """Seconds to wait on a call before hedging it, or None to not hedge"""
+    if not getattr(settings, 'WEATHER_HEDGE_ENABLED', True):
+        return None
+    return tracker.percentile(
+        getattr(settings, 'WEATHER_HEDGE_PERCENTILE', 95),
+        getattr(settings, 'WEATHER_HEDGE_MIN_SAMPLES', 20))
+
+
+def hedged_get(url, timeout, tracker=upstream_latency):
+    """GET ``url``, sending a second request if the first one is a straggler.
+
+    Once the call has taken longer than the configured percentile of recent
+    upstream latencies, an identical request is sent and whichever response
+    arrives first is returned. Without enough samples to know what "slow" is,
+    this is a plain requests.get.
+
+    The primary request gets its own thread, so it never waits for a free
+    slot; a hedge is only sent when one of WEATHER_HEDGE_MAX_WORKERS slots is
+    free at that moment, otherwise the call keeps waiting on the primary.
+    """
+    delay = hedge_delay(tracker)
+    if delay is None or delay >= timeout:
+        return _timed_get(url, timeout, tracker)
+
+    deadline = time.monotonic() + timeout
+    results = queue.SimpleQueue()
+    _start_get(url, timeout, tracker, results)
+    pending = 1
+    hedged = False
+    error = None
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            ok, value = results.get(timeout=remaining if hedged else min(delay, remaining))
+        except queue.Empty:
+            if hedged:
+                break
+            hedged = True
+            slots = _get_hedge_slots()
+            if slots.acquire(blocking=False):
+                _start_get(url, deadline - time.monotonic(), tracker, results,
+                           release=slots.release)
+                pending += 1
+            continue
+        pending -= 1
+        if ok:
+            return value
+        error = value
+    raise error or requests.Timeout(f'No response within {timeout}s')
@@ -0,0 +1,69 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Code run in a fresh interpreter to mimic each kind of process starting up
+PROFILES = {
+    'web': (
+        "from django.core.wsgi import get_wsgi_application\n"
+        "from django.conf import settings\n"
+        "from importlib import import_module\n"
+        "get_wsgi_application()\n"
+        "import_module(settings.ROOT_URLCONF)\n"
+    ),
+    'worker': (
+        "import django\n"
+        "django.setup()\n"
+        "from weather_data_aggregator.celery import app\n"
+        "app.loader.import_default_modules()\n"
+    ),
+}
+
+REPORT = (
+    "import sys\n"
+    "print(sum(1 for name in sys.modules if name.startswith('drf_yasg')))\n"
+)
+
+
+class Command(BaseCommand):
+    help = "Measure cold import time of web and Celery worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help="Fresh interpreters to start per profile.")
+        parser.add_argument('profiles', nargs='*',
+                            help=f"Profiles to measure: {', '.join(PROFILES)} (default: all).")
+
+    def handle(self, *args, runs=5, profiles=None, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'weather_data_aggregator.settings'))
+
+        unknown = set(profiles or ()) - set(PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+
+        for profile in profiles or PROFILES:
+            timings = []
+            docs_modules = 0
+            for _ in range(runs):
+                start = time.perf_counter()
+                completed = subprocess.run(
+                    [sys.executable, '-c', PROFILES[profile] + REPORT],
+                    cwd=settings.BASE_DIR, env=env,
+                    capture_output=True, text=True)
+                if completed.returncode != 0:
+                    raise CommandError(
+                        f"{profile} startup failed (exit {completed.returncode}):\n"
+                        f"{completed.stderr.strip()}")
+                timings.append((time.perf_counter() - start) * 1000)
+                docs_modules = int(completed.stdout.split()[-1])
+
+            self.stdout.write(
+                f"{profile:<8} min {min(timings):7.1f} ms  "
+                f"median {statistics.median(timings):7.1f} ms  "
+                f"drf_yasg modules loaded: {docs_modules}")
@@ -0,0 +1,33 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from weather_data_aggregator.docs import API_INFO, schema_file_path
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema once and write it to WEATHER_OPENAPI_SCHEMA_DIR."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            dest='api_url',
+            default='',
+            help="Base API URL - sets the host and scheme of the generated document.",
+        )
+
+    def handle(self, *args, api_url='', **options):
+        from drf_yasg.app_settings import swagger_settings
+        from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+
+        generator = swagger_settings.DEFAULT_GENERATOR_CLASS(
+            info=API_INFO, url=api_url or swagger_settings.DEFAULT_API_URL)
+        schema = generator.get_schema(request=None, public=True)
+
+        os.makedirs(settings.WEATHER_OPENAPI_SCHEMA_DIR, exist_ok=True)
+        for format, codec in (('.json', OpenAPICodecJson), ('.yaml', OpenAPICodecYaml)):
+            path = schema_file_path(format)
+            with open(path, 'wb') as stream:
+                stream.write(codec(validators=[]).encode(schema))
+            self.stdout.write(self.style.SUCCESS(f"Wrote {path}"))
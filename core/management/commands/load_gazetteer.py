@@ -0,0 +1,42 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Location
+from core.utils import normalize_city
+
+
+class Command(BaseCommand):
+    help = ("Load Location gazetteer rows from a CSV file with name, latitude and "
+            "longitude columns. Aliases (e.g. NYC) are rows with their own name. "
+            "Running workers pick the changes up after a restart.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="Path to the gazetteer CSV file.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, csv_file, batch_size=1000, **options):
+        locations = {}
+        with open(csv_file, newline='', encoding='utf-8') as stream:
+            for line, row in enumerate(csv.DictReader(stream), start=2):
+                try:
+                    name = row['name'].strip()
+                    location = Location(
+                        name=name,
+                        normalized_name=normalize_city(name),
+                        latitude=float(row['latitude']),
+                        longitude=float(row['longitude']),
+                    )
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    raise CommandError(f"{csv_file}:{line}: invalid row ({e})")
+                if location.normalized_name:
+                    locations[location.normalized_name] = location
+
+        Location.objects.bulk_create(
+            locations.values(),
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['normalized_name'],
+            update_fields=['name', 'latitude', 'longitude'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Loaded {len(locations)} locations"))
@@ -0,0 +1,54 @@
+import glob
+import json
+import os
+import pstats
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Summarize the top frames and SQL usage across captured profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', dest='directory', default=None,
+                            help="Profile directory (default: WEATHER_PROFILE_DIR).")
+        parser.add_argument('--name', default=None,
+                            help="Only include captures whose name contains this, "
+                                 "e.g. task-get_weather or view-WeatherRequestListView.")
+        parser.add_argument('--sort', default='cumulative',
+                            choices=['cumulative', 'tottime', 'ncalls'],
+                            help="Sort order for frames.")
+        parser.add_argument('--limit', type=int, default=20,
+                            help="Number of frames to show.")
+
+    def handle(self, *args, directory=None, name=None, sort='cumulative', limit=20, **options):
+        directory = directory or settings.WEATHER_PROFILE_DIR
+        dumps = sorted(glob.glob(os.path.join(directory, '*.prof')))
+        if name:
+            dumps = [path for path in dumps if name in os.path.basename(path)]
+        if not dumps:
+            self.stdout.write(f"No profiles found in {directory}")
+            return
+
+        captures = defaultdict(list)
+        for path in dumps:
+            sidecar = os.path.splitext(path)[0] + '.json'
+            if os.path.exists(sidecar):
+                with open(sidecar) as stream:
+                    capture = json.load(stream)
+                captures[capture['name']].append(capture)
+
+        self.stdout.write(f"{len(dumps)} profiles in {directory}\n")
+        for capture_name, entries in sorted(captures.items()):
+            count = len(entries)
+            self.stdout.write(
+                f"{capture_name:<40} captures {count:>5}  "
+                f"avg wall {sum(e['wall_ms'] for e in entries) / count:9.1f} ms  "
+                f"avg queries {sum(e['sql_queries'] for e in entries) / count:7.1f}  "
+                f"avg sql {sum(e['sql_ms'] for e in entries) / count:9.1f} ms")
+        self.stdout.write('')
+
+        stats = pstats.Stats(*dumps, stream=self.stdout)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
@@ -0,0 +1,66 @@
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from .db_routers import is_pinned_to_primary, replica_reads
+from .utils import get_client_ip
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; responses fall back to gzip
+    brotli = None
+
+re_accepts_brotli = re.compile(r"\bbr\b")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Compress responses with Brotli when installed and accepted, else gzip.
+
+    Streaming responses (e.g. exports) are always gzipped, since they are
+    compressed chunk by chunk.
+    """
+
+    def process_response(self, request, response):
+        if (brotli is None
+                or response.streaming
+                or response.has_header("Content-Encoding")
+                or len(response.content) < 200
+                or not re_accepts_brotli.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        compressed_content = brotli.compress(
+            response.content,
+            quality=getattr(settings, 'WEATHER_BROTLI_QUALITY', 5))
+        # Return the uncompressed content if compression doesn't help
+        if len(compressed_content) >= len(response.content):
+            return response
+
+        response.content = compressed_content
+        response.headers["Content-Length"] = str(len(response.content))
+
+        # As in GZipMiddleware, a strong ETag no longer matches the encoded body
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
+
+
+class ReplicaReadMiddleware:
+    """Let safe requests read from replicas unless the client recently wrote"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # With no replicas configured, skip the pin lookup (a cache round trip)
+        if (not getattr(settings, 'WEATHER_READ_REPLICAS', [])
+                or request.method not in ('GET', 'HEAD')
+                or is_pinned_to_primary(get_client_ip(request))):
+            return self.get_response(request)
+        with replica_reads():
+            return self.get_response(request)
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.3 on 2026-10-19 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_weatherrequest_progress_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weatherrequest',
+            name='city_set_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='weatherrequest',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='weatherrequest',
+            name='task_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='weatherrequest',
+            index=models.Index(fields=['requester_ip', 'city_set_hash', 'created_at'], name='weatherrequest_dedup_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='weatherrequest',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('requester_ip', 'idempotency_key'), name='unique_idempotency_key_per_ip'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-19 06:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_location'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=models.Index(fields=['city', 'id'], name='weatherdata_city_id_idx'),
+        ),
+    ]
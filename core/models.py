@@ -1,4 +1,5 @@
 from django.db import models
+from .utils import normalize_city
 
 
 class WeatherRequest(models.Model):
@@ -7,6 +8,7 @@ class WeatherRequest(models.Model):
         max_length=20,
         choices=[
             ("PENDING", "Pending"),
+            ("IN_PROGRESS", "In Progress"),
             ("SUCCESS", "Success"),
             ("PARTIAL", "Partial Success"),
             ("FAILED", "Failed")
@@ -15,9 +17,30 @@ class WeatherRequest(models.Model):
     )
     city_count = models.PositiveIntegerField(
         default=0)
+    # Updated atomically with F() expressions as each city finishes
+    completed_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    task_id = models.CharField(max_length=255, null=True, blank=True)
+    # Client-supplied Idempotency-Key header, unique per requester IP
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    # core.utils.city_set_hash of the requested cities, for content dedup
+    city_set_hash = models.CharField(max_length=64, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['requester_ip', 'idempotency_key'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='unique_idempotency_key_per_ip',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['requester_ip', 'city_set_hash', 'created_at'],
+                         name='weatherrequest_dedup_idx'),
+        ]
+
 
 class WeatherData(models.Model):
     request = models.ForeignKey(
@@ -27,3 +50,22 @@ class WeatherData(models.Model):
     wind_kph = models.FloatField(null=True, blank=True)
     humidity = models.IntegerField(null=True, blank=True)
     last_updated = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Newest row per city when seeding core.snapshot
+            models.Index(fields=['city', 'id'], name='weatherdata_city_id_idx'),
+        ]
+
+
+class Location(models.Model):
+    """Gazetteer entry mapping a place name (or alias) to coordinates"""
+    name = models.CharField(max_length=100)
+    # core.utils.normalize_city(name), used for lookups
+    normalized_name = models.CharField(max_length=100, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_city(self.name)
+        super().save(*args, **kwargs)
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .utils import city_set_hash
+
+
+def _cache_key(city):
+    return f'weather:unknown-city:{city_set_hash([city])}'
+
+
+def remember_unknown_city(city, message):
+    cache.set(_cache_key(city), message,
+              timeout=getattr(settings, 'WEATHER_NEGATIVE_CACHE_TTL', 900))
+
+
+def get_unknown_city(city):
+    """Return the cached upstream error for ``city`` or None"""
+    return cache.get(_cache_key(city))
+
+
+def get_unknown_cities(cities):
+    """Map each known-bad city in ``cities`` to its cached upstream error"""
+    keys = {_cache_key(city): city for city in cities}
+    return {keys[key]: message for key, message in cache.get_many(keys).items()}
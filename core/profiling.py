@@ -0,0 +1,124 @@
+"""
+Opt-in profiling for API views and Celery tasks.
+
+A capture is taken when forced (X-Profile header on a request, ``profile=True``
+on a task) or, otherwise, for a WEATHER_PROFILE_SAMPLE_RATE fraction of calls.
+Each capture writes a cProfile dump (``.prof``) and a JSON sidecar with wall
+time and SQL query counts/timings to WEATHER_PROFILE_DIR; summarize them with
+``manage.py profile_summary``.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+logger = logging.getLogger(__name__)
+
+# Held for the duration of a capture. cProfile hooks are process-wide on
+# Python 3.12+ (a second enable() raises ValueError), so only one capture
+# runs at a time across all threads; others run unprofiled.
+_capture_lock = threading.Lock()
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times every SQL query"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            self.slowest.append((elapsed, sql))
+            self.slowest = sorted(self.slowest, reverse=True)[:5]
+
+
+def header_requests_profile(request):
+    return (getattr(settings, 'WEATHER_PROFILE_HEADER_ENABLED', False)
+            and request.META.get(PROFILE_HEADER, '').lower() in ('1', 'true', 'yes'))
+
+
+def should_profile(force=False):
+    if _capture_lock.locked():
+        # cProfile cannot nest or overlap; the running capture wins
+        return False
+    if force:
+        return True
+    rate = getattr(settings, 'WEATHER_PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+@contextmanager
+def maybe_profile(name, force=False):
+    """Profile the enclosed block if forced or sampled, else do nothing"""
+    if not should_profile(force) or not _capture_lock.acquire(blocking=False):
+        yield
+        return
+
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # A profiler outside this module owns the process-wide hook;
+            # run the block unprofiled
+            profiler = None
+        if profiler is None:
+            yield
+            return
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                yield
+        finally:
+            profiler.disable()
+            try:
+                _write_capture(name, profiler, recorder, time.perf_counter() - start)
+            except Exception:
+                # Losing a capture must never fail the request or task profiled
+                logger.exception('Could not write profile capture %r to %s',
+                                 name, settings.WEATHER_PROFILE_DIR)
+    finally:
+        _capture_lock.release()
+
+
+def _write_capture(name, profiler, recorder, wall_time):
+    directory = settings.WEATHER_PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(
+        directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}")
+
+    profiler.dump_stats(base + '.prof')
+    with open(base + '.json', 'w') as stream:
+        json.dump({
+            'name': name,
+            'wall_ms': round(wall_time * 1000, 3),
+            'sql_queries': recorder.count,
+            'sql_ms': round(recorder.duration * 1000, 3),
+            'slowest_sql': [
+                {'ms': round(elapsed * 1000, 3), 'sql': sql}
+                for elapsed, sql in recorder.slowest
+            ],
+        }, stream, indent=2)
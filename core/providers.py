@@ -0,0 +1,230 @@
+"""
+Upstream weather providers.
+
+Each provider turns a city name into the WeatherData fields (temperature,
+wind_kph, humidity, last_updated). ProviderPool tries the configured providers
+in order of observed health: providers whose recent error rate crosses
+WEATHER_PROVIDER_MAX_ERROR_RATE are tried last until a probe call to them
+succeeds, the rest fastest first, and a failed call fails over to the next
+provider within the same deadline.
+"""
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .hedging import LatencyTracker, hedged_get
+
+
+class ProviderError(Exception):
+    """The provider answered, but could not return conditions for the city"""
+
+    def __init__(self, message, unknown_location=False):
+        super().__init__(message)
+        self.unknown_location = unknown_location
+
+
+class ProviderHealth:
+    """Latency and error rate of a provider's recent calls.
+
+    A provider whose error rate reaches WEATHER_PROVIDER_MAX_ERROR_RATE stays
+    degraded until a call to it succeeds, even after its failures age out of
+    the window; once per window a single call is let through as a probe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = LatencyTracker()
+        self._outcomes = deque(maxlen=100)
+        self._degraded_at = None
+
+    def record(self, ok, penalty=None):
+        """Record a call outcome; ``penalty`` seconds count as its latency
+        when the call failed without a response (timeouts, connection errors)"""
+        if penalty is not None:
+            self.latency.record(penalty)
+        with self._lock:
+            self._outcomes.append((time.monotonic(), ok))
+            if ok:
+                self._degraded_at = None
+
+    def error_rate(self):
+        window = getattr(settings, 'WEATHER_PROVIDER_HEALTH_WINDOW', 60)
+        since = time.monotonic() - window
+        with self._lock:
+            recent = [ok for at, ok in self._outcomes if at >= since]
+        if len(recent) < getattr(settings, 'WEATHER_PROVIDER_MIN_SAMPLES', 5):
+            return 0.0
+        return recent.count(False) / len(recent)
+
+    def state(self):
+        """'healthy', 'degraded', or 'probe' when the caller may try a
+        degraded provider first to see whether it has recovered"""
+        tripped = self.error_rate() >= getattr(settings, 'WEATHER_PROVIDER_MAX_ERROR_RATE', 0.5)
+        window = getattr(settings, 'WEATHER_PROVIDER_HEALTH_WINDOW', 60)
+        now = time.monotonic()
+        with self._lock:
+            if self._degraded_at is None:
+                if not tripped:
+                    return 'healthy'
+                self._degraded_at = now
+                return 'degraded'
+            if now - self._degraded_at < window:
+                return 'degraded'
+            # Hand out one probe per window; its outcome decides recovery
+            self._degraded_at = now
+            return 'probe'
+
+
+class WeatherProvider:
+    """Base class: subclasses build the request URL and parse the response"""
+
+    name = None
+
+    def __init__(self):
+        self.health = ProviderHealth()
+
+    def build_url(self, city, coordinates=None):
+        """URL for ``city``; ``coordinates`` is a (latitude, longitude) pair
+        from the gazetteer when known, which providers may query instead"""
+        raise NotImplementedError
+
+    def parse(self, payload):
+        """Map a successful response body to WeatherData field values"""
+        raise NotImplementedError
+
+    def is_unknown_location(self, response):
+        return False
+
+    def fetch(self, city, timeout, coordinates=None):
+        response = hedged_get(self.build_url(city, coordinates), timeout=timeout,
+                              tracker=self.health.latency)
+        if response.status_code != 200:
+            raise ProviderError(
+                f'HTTP {response.status_code}: {response.text}',
+                unknown_location=self.is_unknown_location(response))
+        return self.parse(response.json())
+
+
+class WeatherAPIProvider(WeatherProvider):
+    name = 'weatherapi'
+    url = 'https://api.weatherapi.com/v1/current.json'
+    # WeatherAPI error code for "No matching location found."
+    unknown_location_codes = {1006}
+
+    def __init__(self, api_key):
+        super().__init__()
+        self.api_key = api_key
+
+    def build_url(self, city, coordinates=None):
+        if coordinates is not None:
+            # WeatherAPI accepts "lat,lon" as the query
+            return f"{self.url}?key={self.api_key}&q={coordinates[0]:.4f},{coordinates[1]:.4f}"
+        return f"{self.url}?key={self.api_key}&q={city}"
+
+    def parse(self, payload):
+        current = payload.get('current', {})
+
+        # Parse last_updated datetime
+        last_updated_str = current.get('last_updated')
+        last_updated = None
+        if last_updated_str:
+            try:
+                last_updated = datetime.strptime(
+                    last_updated_str, '%Y-%m-%d %H:%M')
+            except ValueError:
+                last_updated = timezone.now()
+
+        return {
+            'temperature': current.get('temp_c'),
+            'wind_kph': current.get('wind_kph'),
+            'humidity': current.get('humidity'),
+            'last_updated': last_updated or timezone.now(),
+        }
+
+    def is_unknown_location(self, response):
+        if response.status_code != 400:
+            return False
+        try:
+            error = response.json().get('error', {})
+        except (ValueError, AttributeError):
+            return False
+        return error.get('code') in self.unknown_location_codes
+
+
+class ProviderPool:
+
+    def __init__(self, providers):
+        self.providers = list(providers)
+
+    # A probe goes first so a recovered provider is noticed; its attempt only
+    # gets a share of the deadline, so the others still have time after it
+    _state_rank = {'probe': 0, 'healthy': 1, 'degraded': 2}
+
+    def ordered(self):
+        """Healthy providers fastest first, then degraded ones"""
+        def sort_key(indexed):
+            index, provider = indexed
+            median = provider.health.latency.percentile(50)
+            # Providers without samples yet are tried early so they get some
+            return (self._state_rank[provider.health.state()], median or 0.0, index)
+
+        return [provider for _, provider in sorted(enumerate(self.providers), key=sort_key)]
+
+    def fetch(self, city, timeout, coordinates=None):
+        """Return ``(provider, fields)`` from the first provider that answers.
+
+        Unknown locations are reported straight away; other errors fail over
+        to the next provider and the last one is re-raised if all fail. Each
+        attempt gets an equal share of the time left among the providers not
+        yet tried, so one that times out leaves the rest time to answer.
+        """
+        deadline = time.monotonic() + timeout
+        error = None
+        providers = self.ordered()
+        for position, provider in enumerate(providers):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            attempt_timeout = remaining / (len(providers) - position)
+            try:
+                fields = provider.fetch(city, timeout=attempt_timeout, coordinates=coordinates)
+            except ProviderError as e:
+                if e.unknown_location:
+                    provider.health.record(True)
+                    raise
+                provider.health.record(False)
+                error = e
+            except requests.RequestException as e:
+                # No response to time: count the attempt's whole budget
+                provider.health.record(False, penalty=attempt_timeout)
+                error = e
+            else:
+                provider.health.record(True)
+                return provider, fields
+        raise error or requests.Timeout(f'No provider answered within {timeout}s')
+
+
+def build_provider(config):
+    provider_class = import_string(config['class'])
+    return provider_class(**config.get('options', {}))
+
+
+@lru_cache(maxsize=None)
+def get_provider_pool():
+    return ProviderPool(build_provider(config) for config in settings.WEATHER_PROVIDERS)
+
+
+@receiver(setting_changed)
+def _reset_provider_pool(setting, **kwargs):
+    if setting in ('WEATHER_PROVIDERS', 'WEATHER_API_KEY'):
+        get_provider_pool.cache_clear()
@@ -1,22 +1,42 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import WeatherRequest, WeatherData
+from .negative_cache import get_unknown_cities
 
 
-class WeatherDataSerializer(serializers.ModelSerializer):
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """ModelSerializer taking an optional ``fields`` kwarg to limit its output"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class WeatherDataSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = WeatherData
         fields = ['id', 'city', 'temperature',
                   'wind_kph', 'humidity', 'last_updated']
 
 
-class WeatherRequestSerializer(serializers.ModelSerializer):
+class WeatherRequestSerializer(DynamicFieldsModelSerializer):
     data = WeatherDataSerializer(many=True, read_only=True)
 
+    def __init__(self, *args, data_fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if data_fields is not None and 'data' in self.fields:
+            self.fields['data'] = WeatherDataSerializer(
+                many=True, read_only=True, fields=data_fields)
+
     class Meta:
         model = WeatherRequest
         fields = ['id', 'requester_ip', 'status', 'city_count',
+                  'completed_count', 'failed_count',
                   'created_at', 'updated_at', 'data']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'completed_count', 'failed_count',
+                            'created_at', 'updated_at']
 
 
 class CityListSerializer(serializers.Serializer):
@@ -27,6 +47,11 @@ class CityListSerializer(serializers.Serializer):
         max_length=10,
         help_text="List of city names to get weather for"
     )
+    bulk = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="Route to the bulk queue regardless of city count"
+    )
 
     def validate_cities(self, value):
         """Custom validation for cities list"""
@@ -39,4 +64,12 @@ class CityListSerializer(serializers.Serializer):
                     "City names cannot be empty or contain only whitespace"
                 )
             validated_cities.append(clean_city)
+
+        # Optionally reject cities the upstream recently failed to resolve
+        if getattr(settings, 'WEATHER_REJECT_UNKNOWN_CITIES', False):
+            unknown = get_unknown_cities(validated_cities)
+            if unknown:
+                raise serializers.ValidationError(
+                    f"Unknown cities: {', '.join(sorted(unknown))}"
+                )
         return validated_cities
@@ -0,0 +1,132 @@
+import math
+import threading
+import time
+from array import array
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Max, Subquery
+
+from .models import WeatherData
+from .utils import normalize_city
+
+
+class LatestSnapshot:
+    """Per-process, array-backed map of city -> latest observed conditions.
+
+    Each city owns one slot in a set of parallel ``array('d')`` columns, so the
+    snapshot costs a few doubles per city instead of a model instance. The
+    first refresh loads only the newest row per city; after that every refresh
+    reads WeatherData rows with an id above the highest one already seen, less
+    ``WEATHER_LATEST_REFRESH_OVERLAP_IDS`` so rows whose transaction committed
+    after a higher id's are still picked up. Refreshes are throttled by
+    ``WEATHER_LATEST_REFRESH_SECONDS`` so frequent polls stay off the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._slots = {}
+        self._names = []
+        self._temperature = array('d')
+        self._wind_kph = array('d')
+        self._humidity = array('d')
+        self._last_updated = array('d')
+        self._row_ids = array('q')
+        self._last_seen_id = 0
+        self._refreshed_at = None
+
+    def refresh(self, force=False):
+        interval = getattr(settings, 'WEATHER_LATEST_REFRESH_SECONDS', 5)
+        # Once seeded, polls arriving during a refresh serve the current
+        # snapshot instead of queueing behind it
+        if not self._lock.acquire(blocking=self._refreshed_at is None):
+            return
+        try:
+            now = time.monotonic()
+            if (not force and self._refreshed_at is not None
+                    and now - self._refreshed_at < interval):
+                return
+            if self._last_seen_id:
+                overlap = getattr(settings, 'WEATHER_LATEST_REFRESH_OVERLAP_IDS', 500)
+                rows = WeatherData.objects.filter(
+                    id__gt=max(self._last_seen_id - overlap, 0))
+            else:
+                rows = self._seed_rows()
+            rows = rows.filter(city__isnull=False).order_by('id').values_list(
+                'id', 'city', 'temperature', 'wind_kph', 'humidity', 'last_updated'
+            ).iterator(chunk_size=2000)
+            for row in rows:
+                self._apply(*row)
+            self._refreshed_at = now
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _seed_rows():
+        """Newest row per city, so the first refresh skips the table history"""
+        latest_ids = WeatherData.objects.filter(city__isnull=False).values(
+            'city').annotate(latest_id=Max('id')).values('latest_id')
+        return WeatherData.objects.filter(id__in=Subquery(latest_ids))
+
+    def _apply(self, row_id, city, temperature, wind_kph, humidity, last_updated):
+        self._last_seen_id = max(self._last_seen_id, row_id)
+        key = normalize_city(city)
+        if not key:
+            return
+        timestamp = last_updated.timestamp() if last_updated else math.nan
+
+        slot = self._slots.get(key)
+        if slot is None:
+            # Grow every column before publishing the slot: get() reads
+            # without the lock
+            slot = len(self._names)
+            self._names.append(city)
+            self._temperature.append(math.nan)
+            self._wind_kph.append(math.nan)
+            self._humidity.append(math.nan)
+            self._last_updated.append(math.nan)
+            self._row_ids.append(0)
+            self._slots[key] = slot
+        else:
+            current = self._last_updated[slot]
+            # Keep the newer observation; the higher row id wins ties, so
+            # re-reading the overlap window is a no-op
+            if not math.isnan(current) and (
+                    math.isnan(timestamp) or timestamp < current
+                    or (timestamp == current and row_id <= self._row_ids[slot])):
+                return
+
+        self._names[slot] = city
+        self._temperature[slot] = math.nan if temperature is None else temperature
+        self._wind_kph[slot] = math.nan if wind_kph is None else wind_kph
+        self._humidity[slot] = math.nan if humidity is None else humidity
+        self._last_updated[slot] = timestamp
+        self._row_ids[slot] = row_id
+
+    def get(self, city):
+        """Return the latest conditions for ``city`` or None if never seen"""
+        slot = self._slots.get(normalize_city(city))
+        if slot is None:
+            return None
+
+        def value(column):
+            number = column[slot]
+            return None if math.isnan(number) else number
+
+        humidity = value(self._humidity)
+        timestamp = value(self._last_updated)
+        return {
+            'city': self._names[slot],
+            'temperature': value(self._temperature),
+            'wind_kph': value(self._wind_kph),
+            'humidity': None if humidity is None else int(humidity),
+            'last_updated': None if timestamp is None else
+            datetime.fromtimestamp(timestamp, tz=dt_timezone.utc).isoformat(),
+            'data_id': self._row_ids[slot],
+        }
+
+
+latest_snapshot = LatestSnapshot()
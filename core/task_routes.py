@@ -0,0 +1,32 @@
+from django.conf import settings
+from kombu.serialization import dumps
+
+
+def _message_size(args, kwargs):
+    """Size in bytes of the task arguments in the configured serializer"""
+    _, _, body = dumps((list(args or ()), kwargs or {}),
+                       serializer=settings.CELERY_TASK_SERIALIZER)
+    return len(body)
+
+
+def route_weather_task(name, args, kwargs, options, task=None, **kw):
+    """Send get_weather to the bulk or interactive queue.
+
+    A request is bulk when the client asked for it or when it has at least
+    WEATHER_BULK_CITY_THRESHOLD cities (args are request_id followed by cities).
+    Large messages are compressed in compact message mode.
+    """
+    if name != 'core.tasks.get_weather':
+        return None
+
+    city_count = max(len(args or ()) - 1, 0)
+    if (kwargs or {}).get('bulk') or city_count >= settings.WEATHER_BULK_CITY_THRESHOLD:
+        route = {'queue': settings.WEATHER_BULK_QUEUE}
+    else:
+        route = {'queue': settings.WEATHER_INTERACTIVE_QUEUE}
+
+    # Only compress messages large enough for it to pay off
+    if (settings.WEATHER_COMPACT_MESSAGES
+            and _message_size(args, kwargs) >= settings.WEATHER_TASK_COMPRESSION_THRESHOLD):
+        route['compression'] = 'zlib'
+    return route
@@ -1,78 +1,132 @@
 from celery import shared_task
 from django.conf import settings
+from django.db.models import F
 from django.utils import timezone
 import requests
+import time
+from .db_routers import pin_to_primary
+from .geo import group_cities
 from .models import WeatherRequest, WeatherData
-from datetime import datetime
+from .profiling import maybe_profile
+from .negative_cache import get_unknown_city, remember_unknown_city
+from .providers import ProviderError, get_provider_pool
+
+
+def record_progress(request_id, succeeded):
+    """Atomically bump the completed/failed counter for a finished city"""
+    counter = 'completed_count' if succeeded else 'failed_count'
+    WeatherRequest.objects.filter(id=request_id).update(
+        **{counter: F(counter) + 1}, updated_at=timezone.now())
+
+
+def record_failures(request_id, result, cities, status, error):
+    """Add a failed result entry and bump failed_count for each city"""
+    for city in cities:
+        result.append({
+            'city': city,
+            'status': status,
+            'error': error
+        })
+        record_progress(request_id, False)
+
+
+def task_result(summary):
+    """Trim the result-backend payload according to WEATHER_TASK_RESULT_MODE.
+
+    Per-city outcomes are already persisted on WeatherRequest/WeatherData.
+    """
+    if settings.WEATHER_TASK_RESULT_MODE != 'full':
+        summary.pop('results')
+        return summary
+    limit = settings.WEATHER_TASK_RESULT_ERROR_CHARS
+    for entry in summary['results']:
+        if len(entry.get('error', '')) > limit:
+            entry['error'] = entry['error'][:limit] + '...'
+    return summary
 
 
 @shared_task
-def get_weather(request_id, *cities):
+def get_weather(request_id, *cities, bulk=False, profile=False):
+    # ``bulk`` is only read by core.task_routes to pick the queue;
+    # ``profile`` forces a capture by core.profiling
+    with maybe_profile('task-get_weather', force=profile):
+        return fetch_weather(request_id, *cities)
+
+
+def fetch_weather(request_id, *cities):
+    """Fetch and store weather for ``cities`` on the given WeatherRequest"""
 
-    api_key = settings.WEATHER_API_KEY
     result = []
     successful_saves = 0
 
     try:
 
         weather_request = WeatherRequest.objects.get(id=request_id)
+        WeatherRequest.objects.filter(id=request_id).update(
+            status='IN_PROGRESS', updated_at=timezone.now())
+
+        deadline = time.monotonic() + settings.WEATHER_TASK_TIME_BUDGET
+        timed_out = 0
+
+        # Cities that resolve to the same place share one upstream fetch
+        for city, coordinates, group in group_cities(cities):
+            # Once the request's time budget is spent, the remaining cities
+            # are marked timed-out so the request can finish with what it has
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out += len(group)
+                record_failures(request_id, result, group, 'timeout',
+                                'Request time budget exceeded')
+                continue
+
+            # Fail cities the upstream recently could not resolve without
+            # spending another API call on them (gazetteer hits are known places)
+            cached_error = None if coordinates else get_unknown_city(city)
+            if cached_error is not None:
+                record_failures(request_id, result, group, 'error',
+                                f'Unknown city (cached): {cached_error}')
+                continue
 
-        for city in cities:
-            url = f"https://api.weatherapi.com/v1/current.json?key={api_key}&q={city}"
             try:
-                response = requests.get(url, timeout=10)
-                print(response)
-
-                if response.status_code == 200:
-                    weather_data = response.json()
-
-                    current = weather_data.get('current', {})
-
-                    # Parse last_updated datetime
-                    last_updated_str = current.get('last_updated')
-                    last_updated = None
-                    if last_updated_str:
-                        try:
-                            last_updated = datetime.strptime(
-                                last_updated_str, '%Y-%m-%d %H:%M')
-                        except ValueError:
-                            last_updated = timezone.now()
+                provider, fields = get_provider_pool().fetch(
+                    city, timeout=min(settings.WEATHER_REQUEST_TIMEOUT, remaining),
+                    coordinates=coordinates)
+            except ProviderError as e:
+                # Handle HTTP errors
+                if e.unknown_location and coordinates is None:
+                    remember_unknown_city(city, str(e))
+                record_failures(request_id, result, group, 'error', str(e))
+                continue
+            except requests.RequestException as e:
+                record_failures(request_id, result, group, 'error',
+                                f'Request failed: {str(e)}')
+                continue
+            except Exception as e:
+                record_failures(request_id, result, group, 'error',
+                                f'Unexpected error: {str(e)}')
+                continue
 
+            # Fan the shared observation back out to one row per city
+            for name in group:
+                try:
                     weather_obj = WeatherData.objects.create(
                         request=weather_request,
-                        city=city,
-                        temperature=current.get('temp_c'),
-                        wind_kph=current.get('wind_kph'),
-                        humidity=current.get('humidity'),
-                        last_updated=last_updated or timezone.now()
+                        city=name,
+                        **fields
                     )
+                except Exception as e:
+                    record_failures(request_id, result, [name], 'error',
+                                    f'Unexpected error: {str(e)}')
+                    continue
 
-                    successful_saves += 1
-                    result.append({
-                        'city': city,
-                        'status': 'success',
-                        'data_id': weather_obj.id
-                    })
-                else:
-                    # Handle HTTP errors
-                    result.append({
-                        'city': city,
-                        'status': 'error',
-                        'error': f'HTTP {response.status_code}: {response.text}'
-                    })
-
-            except requests.RequestException as e:
+                successful_saves += 1
                 result.append({
-                    'city': city,
-                    'status': 'error',
-                    'error': f'Request failed: {str(e)}'
-                })
-            except Exception as e:
-                result.append({
-                    'city': city,
-                    'status': 'error',
-                    'error': f'Unexpected error: {str(e)}'
+                    'city': name,
+                    'status': 'success',
+                    'provider': provider.name,
+                    'data_id': weather_obj.id
                 })
+                record_progress(request_id, True)
 
         # Update WeatherRequest status based on results
         if successful_saves > 0:
@@ -83,15 +137,18 @@ def get_weather(request_id, *cities):
         else:
             weather_request.status = 'FAILED'
 
-        weather_request.save()
+        # Only write the status so the F()-updated counters are not clobbered
+        weather_request.save(update_fields=['status', 'updated_at'])
+        pin_to_primary(weather_request.requester_ip)
 
-        return {
+        return task_result({
             'request_id': request_id,
             'total_cities': len(cities),
             'successful_saves': successful_saves,
+            'timed_out': timed_out,
             'final_status': weather_request.status,
             'results': result
-        }
+        })
 
     except WeatherRequest.DoesNotExist:
         return {
@@ -103,7 +160,7 @@ def get_weather(request_id, *cities):
         try:
             weather_request = WeatherRequest.objects.get(id=request_id)
             weather_request.status = 'FAILED'
-            weather_request.save()
+            weather_request.save(update_fields=['status', 'updated_at'])
         except:
             pass
 
@@ -1,13 +1,34 @@
-from django.test import TestCase, Client
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from unittest.mock import patch, Mock
 from rest_framework import status
 from rest_framework.test import APITestCase
 from .serializers import WeatherRequestSerializer, CityListSerializer, WeatherDataSerializer
-from .models import WeatherRequest, WeatherData
+from .models import WeatherRequest, WeatherData, Location
 from .tasks import get_weather
+from .snapshot import latest_snapshot
+from .task_routes import route_weather_task
+from .profiling import maybe_profile, should_profile
+from .negative_cache import remember_unknown_city
+from .hedging import LatencyTracker, hedged_get
+from .geo import group_cities, location_index
+from .checks import check_replica_pin_cache
+from .db_routers import ReadReplicaRouter, is_pinned_to_primary, replica_reads
+from .providers import (ProviderError, ProviderPool, WeatherAPIProvider,
+                        WeatherProvider, get_provider_pool)
+import io
 import json
+import requests
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
 
 
 class WeatherRequestSerializerTest(TestCase):
@@ -52,6 +73,9 @@ class WeatherRequestSerializerTest(TestCase):
 
 class CityListSerializerTest(TestCase):
 
+    def setUp(self):
+        cache.clear()
+
     def test_valid_city_list(self):
         """Test CityListSerializer with valid cities"""
         data = {"cities": ["London", "Paris", "Tokyo"]}
@@ -93,6 +117,22 @@ class CityListSerializerTest(TestCase):
         self.assertTrue(serializer.is_valid())
         self.assertEqual(len(serializer.validated_data['cities']), 3)
 
+    @override_settings(WEATHER_REJECT_UNKNOWN_CITIES=True)
+    def test_rejects_negatively_cached_cities(self):
+        """Test the optional pre-check rejects cities known to be unresolvable"""
+        remember_unknown_city("Londn", "No matching location found.")
+        serializer = CityListSerializer(data={"cities": ["London", "LONDN"]})
+
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('LONDN', str(serializer.errors['cities']))
+
+    def test_negatively_cached_cities_allowed_by_default(self):
+        """Test the pre-check is opt-in"""
+        remember_unknown_city("Londn", "No matching location found.")
+        serializer = CityListSerializer(data={"cities": ["Londn"]})
+
+        self.assertTrue(serializer.is_valid())
+
     def test_city_names_with_whitespace_trimming(self):
         """Test CityListSerializer trims whitespace from city names"""
         data = {"cities": [" London ", "  Paris  ", "Tokyo"]}
@@ -168,6 +208,119 @@ class WeatherAPIViewTest(APITestCase):
         self.assertEqual(response.json()['cities'], ["London", "Paris"])
         self.assertEqual(response.json()['status'], 'PENDING')
 
+    def test_post_bulk_flag_passed_to_task(self):
+        """Test the bulk flag is forwarded so the router can pick the queue"""
+        data = {"cities": ["London"], "bulk": True}
+
+        with patch('core.views.get_weather.delay') as mock_delay:
+            mock_delay.return_value = Mock(id="test-task-id")
+
+            self.client.post(
+                self.request_weather_url,
+                data=json.dumps(data),
+                content_type='application/json'
+            )
+
+        self.assertTrue(mock_delay.call_args.kwargs['bulk'])
+
+    def _post(self, data, **extra):
+        with patch('core.views.get_weather.delay') as mock_delay:
+            mock_delay.return_value = Mock(id="test-task-id")
+            response = self.client.post(
+                self.request_weather_url,
+                data=json.dumps(data),
+                content_type='application/json',
+                **extra
+            )
+        return response, mock_delay
+
+    def test_idempotency_key_replays_original_request(self):
+        """Test retries with the same Idempotency-Key do not queue new work"""
+        data = {"cities": ["London", "Paris"]}
+
+        first, _ = self._post(data, HTTP_IDEMPOTENCY_KEY="retry-1")
+        second, mock_delay = self._post(data, HTTP_IDEMPOTENCY_KEY="retry-1")
+
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertTrue(second.json()['duplicate'])
+        self.assertEqual(second.json()['request_id'], first.json()['request_id'])
+        self.assertEqual(second.json()['task_id'], "test-task-id")
+        mock_delay.assert_not_called()
+        self.assertEqual(WeatherRequest.objects.count(), 1)
+
+    def test_idempotency_key_reused_for_other_cities(self):
+        """Test a reused Idempotency-Key with a different city set is rejected"""
+        first, _ = self._post({"cities": ["London"]}, HTTP_IDEMPOTENCY_KEY="retry-1")
+        second, mock_delay = self._post(
+            {"cities": ["Paris"]}, HTTP_IDEMPOTENCY_KEY="retry-1")
+
+        self.assertEqual(second.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(second.json()['request_id'], first.json()['request_id'])
+        mock_delay.assert_not_called()
+
+    def test_overlong_idempotency_key_is_rejected(self):
+        """Test keys longer than the stored column are a 400, not a 500"""
+        response, mock_delay = self._post(
+            {"cities": ["London"]}, HTTP_IDEMPOTENCY_KEY="k" * 256)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.json())
+        mock_delay.assert_not_called()
+        self.assertEqual(WeatherRequest.objects.count(), 0)
+
+    @override_settings(WEATHER_DEDUP_WINDOW_SECONDS=60)
+    def test_content_dedup_records_idempotency_key(self):
+        """Test a keyed submission matched by content is still found by its key later"""
+        first, _ = self._post({"cities": ["London"]})
+        second, _ = self._post({"cities": ["London"]}, HTTP_IDEMPOTENCY_KEY="retry-1")
+        self.assertEqual(second.json()['request_id'], first.json()['request_id'])
+
+        WeatherRequest.objects.update(status='SUCCESS')
+        retry, mock_delay = self._post({"cities": ["London"]}, HTTP_IDEMPOTENCY_KEY="retry-1")
+
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.json()['request_id'], first.json()['request_id'])
+        mock_delay.assert_not_called()
+
+    @override_settings(WEATHER_DEDUP_WINDOW_SECONDS=60)
+    def test_content_dedup_skips_request_bound_to_other_key(self):
+        """Test a request already keyed is not reused for a different key"""
+        self._post({"cities": ["London"]}, HTTP_IDEMPOTENCY_KEY="retry-1")
+        response, mock_delay = self._post(
+            {"cities": ["London"]}, HTTP_IDEMPOTENCY_KEY="retry-2")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        mock_delay.assert_called_once()
+        self.assertEqual(WeatherRequest.objects.count(), 2)
+
+    def test_same_cities_without_dedup_window_creates_new_request(self):
+        """Test content dedup is off by default"""
+        data = {"cities": ["London", "Paris"]}
+
+        self._post(data)
+        response, mock_delay = self._post(data)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        mock_delay.assert_called_once()
+        self.assertEqual(WeatherRequest.objects.count(), 2)
+
+    @override_settings(WEATHER_DEDUP_WINDOW_SECONDS=60)
+    def test_content_dedup_within_window(self):
+        """Test same IP and normalized city set reuses the in-flight request"""
+        first, _ = self._post({"cities": ["London", "Paris"]})
+        second, mock_delay = self._post({"cities": ["paris", " LONDON "]})
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.json()['request_id'], first.json()['request_id'])
+        mock_delay.assert_not_called()
+
+        WeatherRequest.objects.update(status='SUCCESS')
+        third, mock_delay = self._post({"cities": ["London", "Paris"]})
+
+        self.assertEqual(third.status_code, status.HTTP_202_ACCEPTED)
+        mock_delay.assert_called_once()
+
     def test_post_invalid_cities(self):
         """Test POST request with invalid cities"""
         data = {"cities": []}  # Empty list
@@ -233,6 +386,8 @@ class WeatherAPIViewTest(APITestCase):
 class WeatherTaskTest(TestCase):
 
     def setUp(self):
+        cache.clear()
+        get_provider_pool.cache_clear()
         self.weather_request = WeatherRequest.objects.create(
             requester_ip="192.168.1.1",
             status="PENDING",
@@ -286,6 +441,126 @@ class WeatherTaskTest(TestCase):
         self.weather_request.refresh_from_db()
         self.assertEqual(self.weather_request.status, 'FAILED')
 
+    @patch('core.tasks.requests.get')
+    def test_progress_counters_updated_per_city(self, mock_get):
+        """Test completed/failed counters are incremented as each city finishes"""
+        ok_response = Mock()
+        ok_response.status_code = 200
+        ok_response.json.return_value = {
+            "current": {"temp_c": 20.0, "wind_kph": 15.0, "humidity": 65}
+        }
+        bad_response = Mock()
+        bad_response.status_code = 400
+        bad_response.text = "No matching location found."
+        mock_get.side_effect = [ok_response, bad_response]
+
+        result = get_weather(self.weather_request.id, "London", "Nowhere")
+
+        self.assertEqual(result['final_status'], 'PARTIAL')
+        self.weather_request.refresh_from_db()
+        self.assertEqual(self.weather_request.status, 'PARTIAL')
+        self.assertEqual(self.weather_request.completed_count, 1)
+        self.assertEqual(self.weather_request.failed_count, 1)
+
+    @patch('core.tasks.requests.get')
+    def test_status_in_progress_while_running(self, mock_get):
+        """Test request is IN_PROGRESS with partial counters mid-task"""
+        seen = []
+
+        def fake_get(url, timeout):
+            request = WeatherRequest.objects.get(id=self.weather_request.id)
+            seen.append((request.status, request.completed_count))
+            response = Mock()
+            response.status_code = 200
+            response.json.return_value = {"current": {"temp_c": 10.0}}
+            return response
+
+        mock_get.side_effect = fake_get
+
+        get_weather(self.weather_request.id, "London", "Paris")
+
+        self.assertEqual(seen, [('IN_PROGRESS', 0), ('IN_PROGRESS', 1)])
+
+    @patch('core.tasks.requests.get')
+    def test_unknown_city_is_negatively_cached(self, mock_get):
+        """Test a city WeatherAPI cannot resolve is failed without a second call"""
+        mock_response = Mock()
+        mock_response.status_code = 400
+        mock_response.text = '{"error":{"code":1006,"message":"No matching location found."}}'
+        mock_response.json.return_value = json.loads(mock_response.text)
+        mock_get.return_value = mock_response
+
+        get_weather(self.weather_request.id, "Londn")
+        result = get_weather(self.weather_request.id, "londn ")
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(result['final_status'], 'FAILED')
+        self.assertIn('Unknown city (cached)', result['results'][0]['error'])
+
+    @patch('core.tasks.requests.get')
+    def test_other_http_errors_are_not_cached(self, mock_get):
+        """Test transient upstream errors still go upstream on the next request"""
+        mock_response = Mock()
+        mock_response.status_code = 503
+        mock_response.text = "Service Unavailable"
+        mock_get.return_value = mock_response
+
+        get_weather(self.weather_request.id, "London")
+        get_weather(self.weather_request.id, "London")
+
+        self.assertEqual(mock_get.call_count, 2)
+
+    @override_settings(WEATHER_TASK_TIME_BUDGET=0.05)
+    @patch('core.tasks.requests.get')
+    def test_time_budget_marks_remaining_cities_timed_out(self, mock_get):
+        """Test cities left when the time budget runs out are timed out"""
+        def slow_get(url, timeout):
+            time.sleep(0.1)
+            response = Mock()
+            response.status_code = 200
+            response.json.return_value = {"current": {"temp_c": 10.0}}
+            return response
+
+        mock_get.side_effect = slow_get
+
+        result = get_weather(self.weather_request.id, "London", "Paris", "Tokyo")
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(result['final_status'], 'PARTIAL')
+        self.assertEqual(result['timed_out'], 2)
+        self.assertEqual(
+            [row['status'] for row in result['results']], ['success', 'timeout', 'timeout'])
+        self.weather_request.refresh_from_db()
+        self.assertEqual(self.weather_request.failed_count, 2)
+
+    @override_settings(WEATHER_TASK_RESULT_ERROR_CHARS=10)
+    @patch('core.tasks.requests.get')
+    def test_result_error_bodies_are_trimmed(self, mock_get):
+        """Test raw upstream error bodies are cut short in the task result"""
+        mock_response = Mock()
+        mock_response.status_code = 500
+        mock_response.text = "x" * 5000
+        mock_get.return_value = mock_response
+
+        result = get_weather(self.weather_request.id, "London")
+
+        self.assertEqual(result['results'][0]['error'], 'HTTP 500: ...')
+
+    @override_settings(WEATHER_TASK_RESULT_MODE='summary')
+    @patch('core.tasks.requests.get')
+    def test_summary_result_mode(self, mock_get):
+        """Test summary mode drops per-city entries but keeps the outcome"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"current": {"temp_c": 20.0}}
+        mock_get.return_value = mock_response
+
+        result = get_weather(self.weather_request.id, "London")
+
+        self.assertNotIn('results', result)
+        self.assertEqual(result['final_status'], 'SUCCESS')
+        self.assertEqual(self.weather_request.data.count(), 1)
+
     def test_nonexistent_request_id(self):
         """Test task with non-existent request ID"""
         result = get_weather(9999, "London")
@@ -320,3 +595,796 @@ class WeatherRequestListViewTest(APITestCase):
         self.assertEqual(response.json()['count'], 1)
         self.assertEqual(
             response.json()['results'][0]['requester_ip'], "192.168.1.1")
+
+
+class WeatherDataExportViewTest(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('core:weather_data_export')
+        first = WeatherRequest.objects.create(
+            requester_ip="192.168.1.1", status="SUCCESS", city_count=2)
+        second = WeatherRequest.objects.create(
+            requester_ip="192.168.1.2", status="SUCCESS", city_count=1)
+        WeatherData.objects.create(
+            request=first, city="London", temperature=20.0, humidity=65,
+            last_updated=datetime(2025, 9, 30, 12, tzinfo=dt_timezone.utc))
+        WeatherData.objects.create(
+            request=first, city="Paris", temperature=18.0, humidity=60,
+            last_updated=datetime(2025, 10, 1, 12, tzinfo=dt_timezone.utc))
+        WeatherData.objects.create(
+            request=second, city="London", temperature=21.0, humidity=70,
+            last_updated=datetime(2025, 10, 2, 12, tzinfo=dt_timezone.utc))
+
+    def _content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        """Test default NDJSON export streams one JSON object per row"""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line)
+                for line in self._content(response).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['city'], "London")
+        self.assertEqual(rows[0]['temperature'], 20.0)
+
+    def test_csv_export_with_filters(self):
+        """Test CSV export filtered by city and requester IP"""
+        response = self.client.get(
+            self.url, {'output': 'csv', 'city': 'london', 'ip': '192.168.1.2'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = self._content(response).splitlines()
+        self.assertEqual(lines[0].split(',')[2], 'city')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('21.0', lines[1])
+
+    def test_time_range_filter(self):
+        """Test export filtered by last_updated range"""
+        response = self.client.get(
+            self.url, {'start': '2025-10-01T00:00:00Z', 'end': '2025-10-01T23:59:59Z'})
+
+        rows = self._content(response).splitlines()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(json.loads(rows[0])['city'], "Paris")
+
+    def test_invalid_parameters(self):
+        """Test unsupported format and bad datetimes are rejected"""
+        response = self.client.get(self.url, {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.url, {'start': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.json())
+
+
+@override_settings(WEATHER_LATEST_REFRESH_SECONDS=0)
+class LatestWeatherViewTest(APITestCase):
+
+    def setUp(self):
+        latest_snapshot.reset()
+        self.url = reverse('core:weather_latest')
+        self.weather_request = WeatherRequest.objects.create(
+            requester_ip="192.168.1.1", status="SUCCESS", city_count=2)
+
+    def _create(self, city, temperature, day):
+        return WeatherData.objects.create(
+            request=self.weather_request, city=city, temperature=temperature,
+            wind_kph=10.0, humidity=50,
+            last_updated=datetime(2025, 10, day, 12, tzinfo=dt_timezone.utc))
+
+    def test_latest_for_multiple_cities(self):
+        """Test newest row per city is returned and unknown cities are listed"""
+        self._create("London", 15.0, 1)
+        self._create("London", 17.0, 2)
+        self._create("Paris", 19.0, 1)
+
+        response = self.client.get(self.url, {'city': 'london,Paris,Atlantis'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = {row['city']: row for row in response.json()['results']}
+        self.assertEqual(results['London']['temperature'], 17.0)
+        self.assertEqual(results['London']['humidity'], 50)
+        self.assertEqual(results['Paris']['temperature'], 19.0)
+        self.assertEqual(response.json()['missing'], ['Atlantis'])
+
+    def test_snapshot_updates_incrementally(self):
+        """Test new rows are picked up and older observations do not win"""
+        self._create("London", 17.0, 2)
+        self.client.get(self.url, {'city': 'London'})
+
+        self._create("London", 12.0, 1)
+        self._create("London", 21.0, 3)
+
+        response = self.client.get(self.url, {'city': 'London'})
+        self.assertEqual(response.json()['results'][0]['temperature'], 21.0)
+
+    def test_first_refresh_seeds_newest_row_per_city(self):
+        """Test the first refresh only loads the newest row of each city"""
+        self._create("London", 15.0, 1)
+        self._create("London", 17.0, 2)
+        self._create("Paris", 19.0, 1)
+
+        with patch.object(latest_snapshot, '_apply',
+                          wraps=latest_snapshot._apply) as mock_apply:
+            with self.assertNumQueries(1):
+                latest_snapshot.refresh(force=True)
+
+        self.assertEqual(mock_apply.call_count, 2)
+        self.assertEqual(latest_snapshot.get("London")['temperature'], 17.0)
+
+    def test_refresh_picks_up_rows_committed_out_of_id_order(self):
+        """Test a row committed after a higher id is not skipped by the watermark"""
+        # Reserve an id below London's, as an uncommitted insert would
+        pending = self._create("Paris", 19.0, 1)
+        self._create("London", 17.0, 2)
+        pending_id = pending.id
+        pending.delete()
+        latest_snapshot.refresh(force=True)
+        self.assertIsNone(latest_snapshot.get("Paris"))
+
+        # The lower id commits after the refresh has seen the higher one
+        WeatherData.objects.create(
+            id=pending_id, request=self.weather_request, city="Paris",
+            temperature=19.0, last_updated=datetime(2025, 10, 1, 12, tzinfo=dt_timezone.utc))
+        latest_snapshot.refresh(force=True)
+
+        self.assertEqual(latest_snapshot.get("Paris")['temperature'], 19.0)
+        self.assertEqual(latest_snapshot.get("London")['temperature'], 17.0)
+
+    @override_settings(WEATHER_LATEST_REFRESH_SECONDS=60)
+    def test_refresh_is_throttled(self):
+        """Test polling within the refresh interval does not query the database"""
+        self._create("London", 17.0, 2)
+        self.client.get(self.url, {'city': 'London'})
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'city': 'London'})
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_city_required(self):
+        """Test request without cities is rejected"""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.json())
+
+
+@override_settings(WEATHER_BULK_CITY_THRESHOLD=3)
+class WeatherTaskRoutingTest(TestCase):
+
+    def test_small_request_goes_to_interactive_queue(self):
+        """Test requests below the threshold use the interactive queue"""
+        route = route_weather_task(
+            'core.tasks.get_weather', (1, "London", "Paris"), {}, {})
+        self.assertEqual(route, {'queue': 'interactive'})
+
+    def test_large_request_goes_to_bulk_queue(self):
+        """Test requests at the city threshold use the bulk queue"""
+        route = route_weather_task(
+            'core.tasks.get_weather', (1, "London", "Paris", "Tokyo"), {}, {})
+        self.assertEqual(route, {'queue': 'bulk'})
+
+    def test_bulk_flag_forces_bulk_queue(self):
+        """Test the API bulk flag overrides the city count"""
+        route = route_weather_task(
+            'core.tasks.get_weather', (1, "London"), {'bulk': True}, {})
+        self.assertEqual(route, {'queue': 'bulk'})
+
+    @override_settings(WEATHER_COMPACT_MESSAGES=True, CELERY_TASK_SERIALIZER='msgpack')
+    def test_large_messages_are_compressed_in_compact_mode(self):
+        """Test only messages above the size threshold request compression"""
+        small = route_weather_task('core.tasks.get_weather', (1, "London"), {}, {})
+        # The largest request the API accepts: 10 cities of 100 characters
+        large = route_weather_task(
+            'core.tasks.get_weather', (1, *["x" * 100] * 10), {}, {})
+
+        self.assertNotIn('compression', small)
+        self.assertEqual(large['compression'], 'zlib')
+
+    def test_msgpack_is_accepted_with_compact_messages_off(self):
+        """Test json-serializing workers still consume queued msgpack messages"""
+        self.assertFalse(settings.WEATHER_COMPACT_MESSAGES)
+        self.assertEqual(settings.CELERY_TASK_SERIALIZER, 'json')
+        self.assertIn('msgpack', settings.CELERY_ACCEPT_CONTENT)
+
+    def test_other_tasks_are_not_routed(self):
+        """Test the router ignores unrelated tasks"""
+        self.assertIsNone(route_weather_task('other.task', (), {}, {}))
+
+
+class OpenAPISchemaTest(TestCase):
+
+    def setUp(self):
+        schema_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(schema_dir.cleanup)
+        self.schema_dir = schema_dir.name
+        settings_override = override_settings(
+            WEATHER_OPENAPI_SCHEMA_DIR=self.schema_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_build_command_writes_served_schema(self):
+        """Test the pre-generated schema is written and served as a file"""
+        call_command('build_openapi_schema', stdout=io.StringIO())
+
+        self.assertTrue(os.path.exists(
+            os.path.join(self.schema_dir, 'swagger.json')))
+        response = self.client.get('/swagger.json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        schema = json.loads(b''.join(response.streaming_content))
+        response.close()
+        self.assertIn('/request/', schema['paths'])
+
+    def test_schema_generated_when_not_prebuilt(self):
+        """Test the schema endpoint falls back to generating the schema"""
+        response = self.client.get('/swagger.json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('/request/', response.json()['paths'])
+
+
+class BenchmarkStartupCommandTest(TestCase):
+
+    @patch('core.management.commands.benchmark_startup.subprocess.run')
+    def test_failed_startup_reports_child_stderr(self, mock_run):
+        """Test a crashing interpreter surfaces as a CommandError with its stderr"""
+        mock_run.return_value = subprocess.CompletedProcess(
+            args=[], returncode=1, stdout='',
+            stderr='ImproperlyConfigured: WEATHER_API_KEY is missing\n')
+
+        with self.assertRaisesMessage(CommandError, 'WEATHER_API_KEY is missing'):
+            call_command('benchmark_startup', 'web', runs=1, stdout=io.StringIO())
+
+
+class HedgedRequestTest(TestCase):
+
+    def setUp(self):
+        self.tracker = LatencyTracker()
+        for _ in range(20):
+            self.tracker.record(0.01)
+
+    def test_percentile_requires_min_samples(self):
+        """Test no hedge delay is known until enough latencies are recorded"""
+        tracker = LatencyTracker()
+        tracker.record(0.5)
+
+        self.assertIsNone(tracker.percentile(95, min_samples=2))
+        self.assertEqual(tracker.percentile(95, min_samples=1), 0.5)
+
+    @patch('core.hedging.requests.get')
+    def test_straggler_is_hedged(self, mock_get):
+        """Test a slow call gets a second request and the first answer wins"""
+        calls = []
+        lock = threading.Lock()
+
+        def fake_get(url, timeout):
+            with lock:
+                calls.append(url)
+                attempt = len(calls)
+            if attempt == 1:
+                time.sleep(0.5)
+                return 'slow'
+            return 'fast'
+
+        mock_get.side_effect = fake_get
+
+        start = time.monotonic()
+        response = hedged_get('https://example.com', timeout=2, tracker=self.tracker)
+
+        self.assertEqual(response, 'fast')
+        self.assertEqual(len(calls), 2)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    @override_settings(WEATHER_HEDGE_MAX_WORKERS=1)
+    @patch('core.hedging.requests.get')
+    def test_concurrent_calls_do_not_queue_behind_hedges(self, mock_get):
+        """Test busy hedge slots never delay or fail primary requests"""
+        def slow_get(url, timeout):
+            time.sleep(0.2)
+            return 'response'
+
+        mock_get.side_effect = slow_get
+        results = []
+
+        def call():
+            try:
+                results.append(hedged_get('https://example.com', timeout=1,
+                                          tracker=self.tracker))
+            except requests.RequestException as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['response'] * 32)
+        # One hedge at most at a time, so far fewer than 64 requests were sent
+        self.assertLess(mock_get.call_count, 64)
+
+    @override_settings(WEATHER_HEDGE_ENABLED=False)
+    @patch('core.hedging.requests.get')
+    def test_hedging_can_be_disabled(self, mock_get):
+        """Test disabled hedging performs a single plain request"""
+        mock_get.return_value = 'response'
+
+        self.assertEqual(hedged_get('https://example.com', timeout=2,
+                                    tracker=self.tracker), 'response')
+        mock_get.assert_called_once_with('https://example.com', timeout=2)
+
+
+class FakeProvider(WeatherProvider):
+
+    def __init__(self, name, outcome):
+        super().__init__()
+        self.name = name
+        self.outcome = outcome
+        self.calls = 0
+
+    def fetch(self, city, timeout, coordinates=None):
+        self.calls += 1
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+class SlowProvider(FakeProvider):
+    """Times out, using up whatever timeout it is given"""
+
+    def __init__(self, name):
+        super().__init__(name, None)
+        self.timeouts = []
+
+    def fetch(self, city, timeout, coordinates=None):
+        self.calls += 1
+        self.timeouts.append(timeout)
+        time.sleep(timeout)
+        raise requests.Timeout('slow')
+
+
+@override_settings(WEATHER_PROVIDER_MIN_SAMPLES=2)
+class ProviderPoolTest(TestCase):
+
+    def test_fails_over_to_next_provider(self):
+        """Test an upstream error falls through to the next provider"""
+        broken = FakeProvider('broken', requests.ConnectionError('down'))
+        backup = FakeProvider('backup', {'temperature': 12.0})
+        pool = ProviderPool([broken, backup])
+
+        provider, fields = pool.fetch("London", timeout=5)
+
+        self.assertIs(provider, backup)
+        self.assertEqual(fields, {'temperature': 12.0})
+
+    def test_degraded_provider_is_tried_last(self):
+        """Test a provider with a high recent error rate loses priority"""
+        broken = FakeProvider('broken', ProviderError('HTTP 503: unavailable'))
+        backup = FakeProvider('backup', {'temperature': 12.0})
+        pool = ProviderPool([broken, backup])
+
+        pool.fetch("London", timeout=5)
+        pool.fetch("Paris", timeout=5)
+        pool.fetch("Tokyo", timeout=5)
+
+        self.assertEqual(pool.ordered(), [backup, broken])
+        self.assertEqual(broken.calls, 2)
+
+    def test_timed_out_provider_leaves_time_for_the_next(self):
+        """Test a provider timing out only uses its share of the deadline"""
+        slow = SlowProvider('slow')
+        backup = FakeProvider('backup', {'temperature': 12.0})
+        pool = ProviderPool([slow, backup])
+
+        provider, fields = pool.fetch("London", timeout=0.1)
+
+        self.assertIs(provider, backup)
+        self.assertEqual(slow.calls, 1)
+        self.assertLessEqual(slow.timeouts[0], 0.05)
+        self.assertGreaterEqual(slow.health.latency.percentile(50), slow.timeouts[0])
+
+    @override_settings(WEATHER_PROVIDER_HEALTH_WINDOW=60)
+    def test_degraded_provider_recovers_only_through_a_probe(self):
+        """Test aged-out failures allow one probe call, not a return to the front"""
+        broken = FakeProvider('broken', requests.ConnectionError('down'))
+        backup = FakeProvider('backup', {'temperature': 12.0})
+        pool = ProviderPool([broken, backup])
+        now = time.monotonic()
+
+        with patch('core.providers.time.monotonic', return_value=now):
+            broken.health.record(False)
+            broken.health.record(False)
+            self.assertEqual(pool.ordered(), [backup, broken])
+
+        with patch('core.providers.time.monotonic', return_value=now + 61):
+            pool.fetch("Tokyo", timeout=5)
+            pool.fetch("Berlin", timeout=5)
+            self.assertEqual(pool.ordered(), [backup, broken])
+        self.assertEqual(broken.calls, 1)
+
+        broken.outcome = {'temperature': 9.0}
+        with patch('core.providers.time.monotonic', return_value=now + 122):
+            provider, _ = pool.fetch("Madrid", timeout=5)
+            self.assertIs(provider, broken)
+            self.assertEqual(broken.health.state(), 'healthy')
+
+    def test_unknown_location_does_not_fail_over(self):
+        """Test an unresolvable city is reported without trying other providers"""
+        primary = FakeProvider('primary', ProviderError(
+            'HTTP 400: No matching location found.', unknown_location=True))
+        backup = FakeProvider('backup', {'temperature': 12.0})
+        pool = ProviderPool([primary, backup])
+
+        with self.assertRaises(ProviderError):
+            pool.fetch("Londn", timeout=5)
+        self.assertEqual(backup.calls, 0)
+
+    def test_all_providers_failing_raises_last_error(self):
+        """Test the last error is raised when every provider fails"""
+        pool = ProviderPool([
+            FakeProvider('first', requests.Timeout('slow')),
+            FakeProvider('second', ProviderError('HTTP 500: boom')),
+        ])
+
+        with self.assertRaisesMessage(ProviderError, 'HTTP 500: boom'):
+            pool.fetch("London", timeout=5)
+
+    def test_coordinates_are_passed_to_providers(self):
+        """Test gazetteer coordinates reach providers separately from the name"""
+        provider = FakeProvider('fake', {'temperature': 12.0})
+        provider.fetch = Mock(return_value={'temperature': 12.0})
+
+        ProviderPool([provider]).fetch("NYC", timeout=5, coordinates=(40.7, -74.0))
+
+        self.assertEqual(provider.fetch.call_args.args[0], "NYC")
+        self.assertEqual(provider.fetch.call_args.kwargs['coordinates'], (40.7, -74.0))
+
+    def test_weatherapi_queries_by_coordinates_when_known(self):
+        """Test WeatherAPI builds a lat,lon query only from explicit coordinates"""
+        provider = WeatherAPIProvider(api_key='key')
+
+        self.assertTrue(provider.build_url("NYC").endswith('q=NYC'))
+        self.assertTrue(provider.build_url(
+            "NYC", (40.7128, -74.006)).endswith('q=40.7128,-74.0060'))
+
+    def test_weatherapi_response_mapping(self):
+        """Test WeatherAPI payloads map onto WeatherData fields"""
+        fields = WeatherAPIProvider(api_key='key').parse({
+            "current": {"temp_c": 20.0, "wind_kph": 15.0, "humidity": 65,
+                        "last_updated": "2025-09-30 12:00"}
+        })
+
+        self.assertEqual(fields['temperature'], 20.0)
+        self.assertEqual(fields['wind_kph'], 15.0)
+        self.assertEqual(fields['humidity'], 65)
+        self.assertEqual(fields['last_updated'], datetime(2025, 9, 30, 12, 0))
+
+
+class SparseFieldsetTest(APITestCase):
+
+    def setUp(self):
+        self.weather_request = WeatherRequest.objects.create(
+            requester_ip="127.0.0.1", status="SUCCESS", city_count=2)
+        for city in ("London", "Paris"):
+            WeatherData.objects.create(
+                request=self.weather_request, city=city,
+                temperature=20.0, wind_kph=10.0, humidity=65)
+        self.detail_url = reverse('core:weather_request_detail', kwargs={
+            'request_id': self.weather_request.id})
+        self.list_url = reverse('core:weather_request_list')
+
+    def test_detail_fields_and_data_fields(self):
+        """Test ?fields= and ?data_fields= limit the returned keys"""
+        response = self.client.get(
+            self.detail_url, {'fields': 'status,data', 'data_fields': 'city,temperature'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.json()), {'status', 'data'})
+        self.assertEqual(set(response.json()['data'][0]), {'city', 'temperature'})
+
+    def test_list_without_data_skips_prefetch(self):
+        """Test leaving out data avoids loading weather rows at all"""
+        with self.assertNumQueries(1):
+            response = self.client.get(self.list_url, {'fields': 'id,status'})
+
+        self.assertEqual(response.json()['results'], [
+            {'id': self.weather_request.id, 'status': 'SUCCESS'}])
+
+    def test_unknown_field_rejected(self):
+        """Test unknown field names return a 400"""
+        response = self.client.get(self.list_url, {'data_fields': 'city,pressure'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pressure', response.json()['error'])
+
+    def test_large_response_is_compressed(self):
+        """Test responses are gzipped for clients that accept it"""
+        response = self.client.get(self.list_url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+
+class LocationGroupingTest(TestCase):
+
+    def setUp(self):
+        location_index.reset()
+        cache.clear()
+        get_provider_pool.cache_clear()
+        Location.objects.create(name="New York", latitude=40.7128, longitude=-74.0060)
+        Location.objects.create(name="NYC", latitude=40.7128, longitude=-74.0060)
+        Location.objects.create(name="Lower Manhattan", latitude=40.7075, longitude=-74.0113)
+        Location.objects.create(name="Boston", latitude=42.3601, longitude=-71.0589)
+
+    def test_nearby_names_share_a_group(self):
+        """Test names in the same grid cell are fetched once by coordinates"""
+        groups = group_cities(["NYC", "new york", "Lower Manhattan", "Boston", "Paris", "paris"])
+
+        self.assertEqual(groups, [
+            ("NYC", (40.7128, -74.0060), ["NYC", "new york", "Lower Manhattan"]),
+            ("Boston", (42.3601, -71.0589), ["Boston"]),
+            ("Paris", None, ["Paris", "paris"]),
+        ])
+
+    @override_settings(WEATHER_GRID_CELL_DEGREES=0)
+    def test_grid_disabled_only_merges_identical_names(self):
+        """Test a zero cell size falls back to name-based grouping"""
+        groups = group_cities(["NYC", "New York", "nyc"])
+
+        self.assertEqual(groups, [("NYC", None, ["NYC", "nyc"]),
+                                  ("New York", None, ["New York"])])
+
+    @patch('core.tasks.requests.get')
+    def test_shared_fetch_fans_out_to_each_city(self, mock_get):
+        """Test one upstream call creates a WeatherData row per requested name"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"current": {"temp_c": 25.0}}
+        mock_get.return_value = mock_response
+        weather_request = WeatherRequest.objects.create(
+            requester_ip="192.168.1.1", city_count=3)
+
+        result = get_weather(weather_request.id, "NYC", "New York", "Lower Manhattan")
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertIn('q=40.7128,-74.0060', mock_get.call_args.args[0])
+        self.assertEqual(result['final_status'], 'SUCCESS')
+        self.assertEqual(
+            sorted(weather_request.data.values_list('city', flat=True)),
+            ["Lower Manhattan", "NYC", "New York"])
+
+    def test_load_gazetteer_command(self):
+        """Test the gazetteer loader inserts and updates locations"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'locations.csv')
+            with open(path, 'w') as stream:
+                stream.write("name,latitude,longitude\nParis,48.8566,2.3522\nnyc,40.7,-74.0\n")
+
+            call_command('load_gazetteer', path, stdout=io.StringIO())
+
+        self.assertEqual(Location.objects.get(normalized_name='paris').latitude, 48.8566)
+        self.assertEqual(Location.objects.get(normalized_name='nyc').latitude, 40.7)
+
+
+class ReplicaPinCacheCheckTest(TestCase):
+    SHARED = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                          'LOCATION': 'redis://localhost:6379/1'}}
+    LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+    @override_settings(WEATHER_READ_REPLICAS=['replica'], CACHES=LOCAL)
+    def test_replica_reads_with_local_cache_fail_check(self):
+        """Test replica reads are refused when pins would be per-process"""
+        errors = check_replica_pin_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+
+    @override_settings(WEATHER_READ_REPLICAS=['replica'], CACHES=SHARED)
+    def test_replica_reads_with_shared_cache_pass_check(self):
+        """Test a shared cache satisfies the pin check"""
+        self.assertEqual(check_replica_pin_cache(None), [])
+
+    @override_settings(WEATHER_READ_REPLICAS=[], CACHES=LOCAL)
+    def test_local_cache_without_replicas_passes_check(self):
+        """Test the default single-database setup keeps a local cache"""
+        self.assertEqual(check_replica_pin_cache(None), [])
+
+
+@override_settings(WEATHER_READ_REPLICAS=['replica'])
+class ReadReplicaRoutingTest(APITestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        get_provider_pool.cache_clear()
+        self.list_url = reverse('core:weather_request_list')
+        # Rows only on the primary, as if replication had not caught up yet
+        self.weather_request = WeatherRequest.objects.create(
+            requester_ip="127.0.0.1", status="SUCCESS", city_count=1)
+
+    def test_reads_are_served_by_replica(self):
+        """Test list and detail reads go to the replica alias"""
+        WeatherRequest.objects.using('replica').create(
+            requester_ip="127.0.0.1", status="PENDING", city_count=2)
+
+        response = self.client.get(self.list_url)
+
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(response.json()['results'][0]['status'], 'PENDING')
+
+        primary_only = WeatherRequest.objects.create(
+            requester_ip="127.0.0.1", status="SUCCESS", city_count=1)
+        url = reverse('core:weather_request_detail', kwargs={
+            'request_id': primary_only.id})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_submitting_pins_client_to_primary(self):
+        """Test a client reads its own writes right after submitting"""
+        with patch('core.views.get_weather.delay') as mock_delay:
+            mock_delay.return_value = Mock(id="test-task-id")
+            self.client.post(
+                reverse('core:request_weather'),
+                data=json.dumps({"cities": ["London"]}),
+                content_type='application/json'
+            )
+
+        response = self.client.get(self.list_url)
+
+        self.assertEqual(response.json()['count'], 2)
+
+    @patch('core.tasks.requests.get')
+    def test_task_completion_pins_requester(self, mock_get):
+        """Test a finished task pins its requester to the primary"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"current": {"temp_c": 20.0}}
+        mock_get.return_value = mock_response
+
+        self.assertFalse(is_pinned_to_primary("127.0.0.1"))
+        get_weather(self.weather_request.id, "London")
+
+        self.assertTrue(is_pinned_to_primary("127.0.0.1"))
+        self.assertEqual(self.client.get(self.list_url).json()['count'], 1)
+
+    def test_reads_outside_requests_use_primary(self):
+        """Test tasks and other non-request code are not routed to replicas"""
+        self.assertIsNone(ReadReplicaRouter().db_for_read(WeatherRequest))
+        self.assertEqual(WeatherRequest.objects.count(), 1)
+
+    @override_settings(WEATHER_READ_REPLICAS=['replica', 'replica-2'])
+    def test_one_replica_serves_a_whole_request(self):
+        """Test every read in a replica context uses the same replica"""
+        router = ReadReplicaRouter()
+
+        with replica_reads():
+            aliases = {router.db_for_read(WeatherRequest) for _ in range(50)}
+
+        self.assertEqual(len(aliases), 1)
+
+    @override_settings(WEATHER_READ_REPLICAS=[])
+    def test_no_pin_lookup_without_replicas(self):
+        """Test reads skip the primary-pin cache lookup when replicas are off"""
+        with patch('core.middleware.is_pinned_to_primary') as mock_pinned:
+            response = self.client.get(self.list_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_pinned.assert_not_called()
+
+
+class ProfilingTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_provider_pool.cache_clear()
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        self.profile_dir = profile_dir.name
+        settings_override = override_settings(
+            WEATHER_PROFILE_DIR=self.profile_dir,
+            WEATHER_PROFILE_HEADER_ENABLED=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.list_url = reverse('core:weather_request_list')
+
+    def _captures(self):
+        return sorted(os.listdir(self.profile_dir))
+
+    def test_header_triggers_view_profile(self):
+        """Test the X-Profile header writes a cProfile dump and SQL stats"""
+        self.client.get(self.list_url, HTTP_X_PROFILE='1')
+
+        captures = self._captures()
+        self.assertEqual(len(captures), 2)
+        self.assertTrue(captures[0].endswith('.json'))
+        self.assertIn('view-WeatherRequestListView', captures[0])
+        with open(os.path.join(self.profile_dir, captures[0])) as stream:
+            self.assertEqual(json.load(stream)['sql_queries'], 1)
+
+    def test_requests_are_not_profiled_by_default(self):
+        """Test nothing is captured without a header or sample rate"""
+        self.client.get(self.list_url)
+
+        self.assertEqual(self._captures(), [])
+
+    @override_settings(WEATHER_PROFILE_HEADER_ENABLED=False)
+    def test_header_ignored_when_disabled(self):
+        """Test the header has no effect unless enabled"""
+        self.client.get(self.list_url, HTTP_X_PROFILE='1')
+
+        self.assertEqual(self._captures(), [])
+
+    @patch('core.tasks.requests.get')
+    def test_task_kwarg_triggers_profile_and_summary(self, mock_get):
+        """Test profile=True captures the task and the summary reads it"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"current": {"temp_c": 20.0}}
+        mock_get.return_value = mock_response
+        weather_request = WeatherRequest.objects.create(
+            requester_ip="192.168.1.1", city_count=1)
+
+        result = get_weather(weather_request.id, "London", profile=True)
+
+        self.assertEqual(result['final_status'], 'SUCCESS')
+        self.assertTrue(any('task-get_weather' in name for name in self._captures()))
+
+        output = io.StringIO()
+        call_command('profile_summary', stdout=output)
+        summary = output.getvalue()
+        self.assertIn('task-get_weather', summary)
+        self.assertIn('fetch_weather', summary)
+
+    def test_concurrent_captures_profile_only_one(self):
+        """Test overlapping captures run both blocks but profile only one"""
+        both_inside = threading.Barrier(2, timeout=5)
+        errors = []
+
+        def capture(name):
+            try:
+                with maybe_profile(name, force=True):
+                    both_inside.wait()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=capture, args=(f'concurrent-{i}',))
+                   for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self._captures()), 2)
+
+        with maybe_profile('after', force=True):
+            pass
+        self.assertEqual(len(self._captures()), 4)
+
+    @patch('core.profiling.cProfile.Profile')
+    def test_block_runs_unprofiled_when_enable_fails(self, mock_profile):
+        """Test a profiler already active elsewhere does not break the block"""
+        mock_profile.return_value.enable.side_effect = ValueError(
+            'Another profiling tool is already active')
+        ran = []
+
+        with maybe_profile('busy', force=True):
+            ran.append(True)
+
+        self.assertEqual(ran, [True])
+        self.assertEqual(self._captures(), [])
+        self.assertTrue(should_profile(force=True))
+
+    def test_capture_write_failure_does_not_fail_block(self):
+        """Test an unwritable profile directory is logged, not raised"""
+        not_a_directory = os.path.join(self.profile_dir, 'file')
+        open(not_a_directory, 'w').close()
+
+        with override_settings(WEATHER_PROFILE_DIR=not_a_directory):
+            with self.assertLogs('core.profiling', level='ERROR'):
+                response = self.client.get(self.list_url, HTTP_X_PROFILE='1')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(should_profile(force=True))
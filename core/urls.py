@@ -1,5 +1,7 @@
 from django.urls import path
-from .views import RequestWeatherView, WeatherRequestDetailView, WeatherRequestListView
+from .views import (RequestWeatherView, WeatherRequestDetailView,
+                    WeatherRequestListView, WeatherDataExportView,
+                    LatestWeatherView)
 
 app_name = 'core'
 
@@ -9,4 +11,7 @@ urlpatterns = [
          WeatherRequestDetailView.as_view(), name='weather_request_detail'),
     path('weather/requests/', WeatherRequestListView.as_view(),
          name='weather_request_list'),
+    path('weather/export/', WeatherDataExportView.as_view(),
+         name='weather_data_export'),
+    path('weather/latest/', LatestWeatherView.as_view(), name='weather_latest'),
 ]
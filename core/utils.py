@@ -0,0 +1,21 @@
+import hashlib
+
+
+def normalize_city(city):
+    """Case- and whitespace-insensitive key for a city name"""
+    return ' '.join(city.split()).casefold()
+
+
+def city_set_hash(cities):
+    """Stable digest of a request's city set, ignoring order, case and duplicates"""
+    normalized = sorted({normalize_city(city) for city in cities})
+    return hashlib.sha256('\n'.join(normalized).encode()).hexdigest()
+
+
+def get_client_ip(request):
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = x_forwarded_for.split(',')[0].strip()
+    else:
+        ip = request.META.get('REMOTE_ADDR')
+    return ip
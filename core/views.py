@@ -1,18 +1,86 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from .serializers import WeatherRequestSerializer, CityListSerializer
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
+from django.db.models import Prefetch
+from .serializers import WeatherRequestSerializer, WeatherDataSerializer, CityListSerializer
 from .models import WeatherRequest, WeatherData
 from .tasks import get_weather
+from .exports import STREAMERS, EXPORT_CONTENT_TYPES
+from .snapshot import latest_snapshot
+from .utils import city_set_hash, get_client_ip
+from .db_routers import pin_to_primary
+from .profiling import header_requests_profile, maybe_profile
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 
-class RequestWeatherView(APIView):
+class ProfiledAPIView(APIView):
+    """APIView whose requests can be profiled (see core.profiling)"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with maybe_profile(f'view-{type(self).__name__}',
+                           force=header_requests_profile(request)):
+            return super().dispatch(request, *args, **kwargs)
+
+
+FIELD_SELECTION_PARAMETERS = [
+    openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description="Comma-separated request fields to return, "
+                                  "e.g. status,data"),
+    openapi.Parameter('data_fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description="Comma-separated weather data fields to return, "
+                                  "e.g. city,temperature"),
+]
+
+
+def parse_field_selection(request):
+    """Read ?fields= and ?data_fields= into name lists (None when absent)"""
+    selection = []
+    for param, allowed in (('fields', WeatherRequestSerializer.Meta.fields),
+                           ('data_fields', WeatherDataSerializer.Meta.fields)):
+        value = request.query_params.get(param)
+        if value is None:
+            selection.append(None)
+            continue
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = sorted(set(names) - set(allowed))
+        if unknown:
+            raise ValueError(f"Unknown {param}: {', '.join(unknown)}")
+        selection.append(names)
+    return selection
+
+
+def select_weather_requests(queryset, fields, data_fields):
+    """Only load the columns (and related rows) the selected fields need"""
+    if fields is not None:
+        queryset = queryset.only('id', *(name for name in fields if name != 'data'))
+    if fields is None or 'data' in fields:
+        data_queryset = WeatherData.objects.all()
+        if data_fields is not None:
+            data_queryset = data_queryset.only('id', 'request_id', *data_fields)
+        queryset = queryset.prefetch_related(Prefetch('data', queryset=data_queryset))
+    return queryset
+
+
+class RequestWeatherView(ProfiledAPIView):
     @swagger_auto_schema(
         request_body=CityListSerializer,
-        responses={201: "Weather request created"}
+        manual_parameters=[
+            openapi.Parameter('Idempotency-Key', openapi.IN_HEADER,
+                              type=openapi.TYPE_STRING,
+                              description="Retries with the same key return the "
+                                          "original request instead of queueing new work"),
+        ],
+        responses={202: "Weather request created",
+                   200: "Duplicate of an existing weather request",
+                   400: "Invalid cities or Idempotency-Key",
+                   422: "Idempotency-Key reused for a different set of cities"}
     )
     def post(self, request):
 
@@ -27,16 +95,46 @@ class RequestWeatherView(APIView):
         cities = serializer.validated_data['cities']
 
         client_ip = self.get_client_ip(request)
+        idempotency_key = request.headers.get('Idempotency-Key') or None
+        max_key_length = WeatherRequest._meta.get_field('idempotency_key').max_length
+        if idempotency_key and len(idempotency_key) > max_key_length:
+            return Response(
+                {'error': 'Invalid Idempotency-Key',
+                 'details': f'Must be at most {max_key_length} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        cities_hash = city_set_hash(cities)
 
-        weather_request = WeatherRequest.objects.create(
-            requester_ip=client_ip,
-            city_count=len(cities),
-            status='PENDING'
-        )
+        existing = self.find_duplicate(client_ip, idempotency_key, cities_hash)
+        if existing is not None:
+            return self.duplicate_response(existing, cities, cities_hash)
+
+        try:
+            with transaction.atomic():
+                weather_request = WeatherRequest.objects.create(
+                    requester_ip=client_ip,
+                    city_count=len(cities),
+                    status='PENDING',
+                    idempotency_key=idempotency_key,
+                    city_set_hash=cities_hash
+                )
+        except IntegrityError:
+            # A concurrent retry with the same Idempotency-Key won the race
+            existing = WeatherRequest.objects.get(
+                requester_ip=client_ip, idempotency_key=idempotency_key)
+            return self.duplicate_response(existing, cities, cities_hash)
+
+        # Read-your-writes: this client's next reads go to the primary
+        pin_to_primary(client_ip)
 
         try:
-            # Pass request_id as first argument to the task
-            task_result = get_weather.delay(weather_request.id, *cities)
+            # Pass request_id as first argument to the task; the queue is
+            # chosen by core.task_routes from the city count and bulk flag
+            task_result = get_weather.delay(
+                weather_request.id, *cities,
+                bulk=serializer.validated_data['bulk'])
+            weather_request.task_id = str(task_result.id)
+            weather_request.save(update_fields=['task_id'])
 
             return Response({
                 'message': 'Weather request submitted successfully',
@@ -58,19 +156,83 @@ class RequestWeatherView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @staticmethod
-    def get_client_ip(request):
+    def find_duplicate(client_ip, idempotency_key, cities_hash):
+        """Return an earlier request this submission duplicates, if any.
+
+        A matching Idempotency-Key always wins. Otherwise, when
+        WEATHER_DEDUP_WINDOW_SECONDS is set, an in-flight request from the same
+        IP for the same city set within the window is reused; a submitted key
+        is then recorded on it so retries still find it once it has finished.
+        """
+        if idempotency_key:
+            existing = WeatherRequest.objects.filter(
+                requester_ip=client_ip, idempotency_key=idempotency_key).first()
+            if existing is not None:
+                return existing
+
+        window = getattr(settings, 'WEATHER_DEDUP_WINDOW_SECONDS', 0)
+        if not window:
+            return None
+        duplicate = WeatherRequest.objects.filter(
+            requester_ip=client_ip,
+            city_set_hash=cities_hash,
+            status__in=['PENDING', 'IN_PROGRESS'],
+            task_id__isnull=False,
+            created_at__gte=timezone.now() - timedelta(seconds=window)
+        ).order_by('-created_at').first()
+        if duplicate is None or not idempotency_key:
+            return duplicate
+
+        try:
+            with transaction.atomic():
+                claimed = WeatherRequest.objects.filter(
+                    pk=duplicate.pk, idempotency_key__isnull=True
+                ).update(idempotency_key=idempotency_key)
+        except IntegrityError:
+            # A concurrent retry with the same key created its own request
+            return WeatherRequest.objects.get(
+                requester_ip=client_ip, idempotency_key=idempotency_key)
+        if not claimed:
+            # Already bound to another key; queue this one under its own key
+            return None
+        duplicate.idempotency_key = idempotency_key
+        return duplicate
+
+    @staticmethod
+    def duplicate_response(weather_request, cities, cities_hash):
+        """Replay ``weather_request`` for a duplicate submission.
+
+        Duplicates always have the same normalized city set, so the submitted
+        cities describe what was queued; an Idempotency-Key reused for other
+        cities is rejected with 422. ``task_id`` is null when a concurrent
+        retry lost the race before the original request was queued; clients
+        should poll ``request_id`` instead.
+        """
+        if weather_request.city_set_hash != cities_hash:
+            return Response(
+                {'error': 'Idempotency-Key was already used for a different set of cities',
+                 'request_id': weather_request.id},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        return Response({
+            'message': 'Duplicate of an existing weather request',
+            'request_id': weather_request.id,
+            'task_id': weather_request.task_id,
+            'cities': cities,
+            'status': weather_request.status,
+            'duplicate': True
+        }, status=status.HTTP_200_OK)
 
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0].strip()
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+    @staticmethod
+    def get_client_ip(request):
+        return get_client_ip(request)
 
 
-class WeatherRequestDetailView(APIView):
+class WeatherRequestDetailView(ProfiledAPIView):
     @swagger_auto_schema(
-        operation_description="Get detailed weather request with all weather data",
+        operation_description="Get detailed weather request with all weather data "
+                              "saved so far (partial results while IN_PROGRESS)",
+        manual_parameters=FIELD_SELECTION_PARAMETERS,
         responses={
             200: WeatherRequestSerializer,
             404: openapi.Response(
@@ -85,10 +247,16 @@ class WeatherRequestDetailView(APIView):
     )
     def get(self, request, request_id):
         try:
+            fields, data_fields = parse_field_selection(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            weather_request = WeatherRequest.objects.prefetch_related(
-                'data').get(id=request_id)
-            serializer = WeatherRequestSerializer(weather_request)
+        try:
+
+            weather_request = select_weather_requests(
+                WeatherRequest.objects.all(), fields, data_fields).get(id=request_id)
+            serializer = WeatherRequestSerializer(
+                weather_request, fields=fields, data_fields=data_fields)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         except WeatherRequest.DoesNotExist:
@@ -98,22 +266,130 @@ class WeatherRequestDetailView(APIView):
             )
 
 
-class WeatherRequestListView(APIView):
+class WeatherRequestListView(ProfiledAPIView):
     @swagger_auto_schema(
         operation_description="List all weather requests for the current user (filtered by IP)",
+        manual_parameters=FIELD_SELECTION_PARAMETERS,
         responses={200: WeatherRequestSerializer(many=True)}
     )
     def get(self, request):
+        try:
+            fields, data_fields = parse_field_selection(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         # Get client IP address
         ip = RequestWeatherView.get_client_ip(request)
 
         # Filter requests by client IP and prefetch related data
-        queryset = WeatherRequest.objects.filter(
+        queryset = select_weather_requests(WeatherRequest.objects.filter(
             requester_ip=ip
-        ).prefetch_related('data').order_by('-created_at')
+        ), fields, data_fields).order_by('-created_at')
 
-        serializer = WeatherRequestSerializer(queryset, many=True)
+        serializer = WeatherRequestSerializer(
+            queryset, many=True, fields=fields, data_fields=data_fields)
         return Response({
             'count': len(serializer.data),
             'results': serializer.data
         }, status=status.HTTP_200_OK)
+
+
+class WeatherDataExportView(ProfiledAPIView):
+    @swagger_auto_schema(
+        operation_description="Stream WeatherData as NDJSON or CSV. Rows are read "
+                              "through a server-side cursor so memory stays constant.",
+        manual_parameters=[
+            openapi.Parameter('output', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              enum=list(STREAMERS), default='ndjson'),
+            openapi.Parameter('city', openapi.IN_QUERY,
+                              type=openapi.TYPE_STRING),
+            openapi.Parameter('ip', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Requester IP of the parent request"),
+            openapi.Parameter('start', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              format=openapi.FORMAT_DATETIME,
+                              description="Minimum last_updated (ISO 8601)"),
+            openapi.Parameter('end', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              format=openapi.FORMAT_DATETIME,
+                              description="Maximum last_updated (ISO 8601)"),
+        ]
+    )
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in STREAMERS:
+            return Response(
+                {'error': f'Unsupported output format: {output}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Bind the database now: rows are streamed after the request (and its
+        # replica routing context) has been handled
+        queryset = WeatherData.objects.all()
+        queryset = queryset.using(queryset.db)
+
+        city = request.query_params.get('city')
+        if city:
+            queryset = queryset.filter(city__iexact=city.strip())
+
+        ip = request.query_params.get('ip')
+        if ip:
+            queryset = queryset.filter(request__requester_ip=ip)
+
+        for param, lookup in (('start', 'last_updated__gte'), ('end', 'last_updated__lte')):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            parsed = parse_datetime(value)
+            if parsed is None:
+                return Response(
+                    {'error': f'Invalid datetime for {param}: {value}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.filter(**{lookup: parsed})
+
+        response = StreamingHttpResponse(
+            STREAMERS[output](queryset),
+            content_type=EXPORT_CONTENT_TYPES[output]
+        )
+        response['Content-Disposition'] = f'attachment; filename="weather_data.{output}"'
+        return response
+
+
+class LatestWeatherView(ProfiledAPIView):
+    @swagger_auto_schema(
+        operation_description="Latest known conditions for one or many cities, served "
+                              "from an in-memory snapshot refreshed incrementally",
+        manual_parameters=[
+            openapi.Parameter('city', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="City name; repeat the parameter or "
+                                          "comma-separate for several cities",
+                              required=True),
+        ]
+    )
+    def get(self, request):
+        cities = [
+            city.strip()
+            for value in request.query_params.getlist('city')
+            for city in value.split(',')
+            if city.strip()
+        ]
+        if not cities:
+            return Response(
+                {'error': 'At least one city is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        latest_snapshot.refresh()
+
+        results = []
+        missing = []
+        for city in cities:
+            conditions = latest_snapshot.get(city)
+            if conditions is None:
+                missing.append(city)
+            else:
+                results.append(conditions)
+
+        return Response({
+            'results': results,
+            'missing': missing
+        }, status=status.HTTP_200_OK)
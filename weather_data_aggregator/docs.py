@@ -0,0 +1,72 @@
+"""
+API documentation views.
+
+drf_yasg's schema generator, inspectors and renderers are only imported the
+first time a docs endpoint is hit, so web and worker processes that never
+serve docs do not pay for them at startup. ``manage.py build_openapi_schema``
+writes the schema to WEATHER_OPENAPI_SCHEMA_DIR at build time; when present,
+that file is served as-is instead of re-walking every view on each request.
+"""
+
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import FileResponse
+from drf_yasg import openapi
+
+API_INFO = openapi.Info(
+    title="Weather API",
+    default_version="v1",
+    description="API documentation for WeatherRequest and WeatherData",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="your@email.com"),
+    license=openapi.License(name="MIT License"),
+)
+
+SCHEMA_CONTENT_TYPES = {
+    '.json': 'application/json',
+    '.yaml': 'application/yaml',
+}
+
+
+@lru_cache(maxsize=None)
+def get_schema_view():
+    from drf_yasg.views import get_schema_view as build_schema_view
+    from rest_framework import permissions
+
+    return build_schema_view(
+        API_INFO,
+        public=True,
+        permission_classes=[permissions.AllowAny],
+    )
+
+
+@lru_cache(maxsize=None)
+def get_docs_view(renderer=None):
+    """drf_yasg view for ``renderer`` ('swagger', 'redoc' or None for raw schema)"""
+    cache_timeout = settings.WEATHER_OPENAPI_CACHE_TIMEOUT
+    if renderer is None:
+        return get_schema_view().without_ui(cache_timeout=cache_timeout)
+    return get_schema_view().with_ui(renderer, cache_timeout=cache_timeout)
+
+
+def schema_file_path(format):
+    return os.path.join(settings.WEATHER_OPENAPI_SCHEMA_DIR, f'swagger{format}')
+
+
+def schema(request, format):
+    """Serve the pre-generated schema file, falling back to a cached build"""
+    path = schema_file_path(format)
+    if os.path.exists(path):
+        return FileResponse(open(path, 'rb'),
+                            content_type=SCHEMA_CONTENT_TYPES[format])
+    return get_docs_view()(request, format=format)
+
+
+def swagger_ui(request):
+    return get_docs_view('swagger')(request)
+
+
+def redoc(request):
+    return get_docs_view('redoc')(request)
@@ -2,6 +2,8 @@
 
 from pathlib import Path
 import environ
+from django.core.exceptions import ImproperlyConfigured
+from kombu import Queue
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -41,6 +43,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.ReplicaReadMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -80,6 +84,36 @@ DATABASES = {
     }
 }
 
+# Read replicas for list, detail and history queries (core.db_routers).
+# DATABASE_REPLICA_URLS takes comma-separated database URLs, registered as
+# replica1, replica2, ... Without it a local "replica" alias on the SQLite
+# file is defined (each alias gets its own database in tests), and replica
+# reads stay off unless WEATHER_READ_REPLICAS names it.
+_replica_urls = env.list('DATABASE_REPLICA_URLS', default=[])
+for _index, _url in enumerate(_replica_urls, start=1):
+    DATABASES[f'replica{_index}'] = environ.Env.db_url_config(_url)
+if not _replica_urls:
+    DATABASES['replica'] = dict(DATABASES['default'])
+
+WEATHER_READ_REPLICAS = env.list(
+    'WEATHER_READ_REPLICAS',
+    default=[f'replica{_index}' for _index in range(1, len(_replica_urls) + 1)])
+# Clients read from the primary for this many seconds after they submit a
+# request or one of their tasks completes. Pins live in the default cache,
+# which must be shared when replica reads are on (system check core.E001).
+WEATHER_REPLICA_PIN_SECONDS = env.int('WEATHER_REPLICA_PIN_SECONDS', default=10)
+
+DATABASE_ROUTERS = ['core.db_routers.ReadReplicaRouter']
+
+
+# Cache
+# Use a shared backend (e.g. CACHE_URL=redis://localhost:6379/1) so every web
+# and worker process sees the same entries
+
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -117,6 +151,23 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# API docs
+# Pre-generated by `manage.py build_openapi_schema`; the UIs load it from
+# /swagger.json instead of embedding a freshly generated schema
+
+WEATHER_OPENAPI_SCHEMA_DIR = env.path(
+    'WEATHER_OPENAPI_SCHEMA_DIR', default=BASE_DIR / 'openapi')
+# Cache lifetime for schema/UI responses built on the fly
+WEATHER_OPENAPI_CACHE_TIMEOUT = env.int('WEATHER_OPENAPI_CACHE_TIMEOUT', default=86400)
+
+SWAGGER_SETTINGS = {
+    'DEFAULT_INFO': 'weather_data_aggregator.docs.API_INFO',
+    'SPEC_URL': '/swagger.json',
+}
+REDOC_SETTINGS = {
+    'SPEC_URL': '/swagger.json',
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -127,14 +178,148 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CELERY_BROKER_URL = env("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = env("CELERY_RESULT_BACKEND")
 
-# Windows-specific Celery settings to fix permission issues
-CELERY_WORKER_POOL = 'solo'  # Use solo pool for Windows compatibility
+# Task queues: small interactive requests are kept apart from bulk ones so
+# large submissions cannot block them (see core.task_routes)
+WEATHER_INTERACTIVE_QUEUE = 'interactive'
+WEATHER_BULK_QUEUE = 'bulk'
+# Requests with at least this many cities are routed to the bulk queue
+WEATHER_BULK_CITY_THRESHOLD = env.int('WEATHER_BULK_CITY_THRESHOLD', default=5)
+
+CELERY_TASK_DEFAULT_QUEUE = WEATHER_INTERACTIVE_QUEUE
+CELERY_TASK_DEFAULT_EXCHANGE = 'weather'
+CELERY_TASK_QUEUES = (
+    Queue(WEATHER_INTERACTIVE_QUEUE, routing_key=WEATHER_INTERACTIVE_QUEUE),
+    Queue(WEATHER_BULK_QUEUE, routing_key=WEATHER_BULK_QUEUE),
+)
+CELERY_TASK_ROUTES = ('core.task_routes.route_weather_task',)
+
+# Worker pool profiles, selected per worker process:
+#   WEATHER_WORKER_PROFILE=windows     solo pool, kept for Windows development
+#   WEATHER_WORKER_PROFILE=production  Linux pools sized for I/O-bound get_weather
+# WEATHER_WORKER_QUEUE picks the per-queue concurrency/prefetch and should match
+# the -Q option the worker is started with, e.g.
+#   WEATHER_WORKER_PROFILE=production WEATHER_WORKER_QUEUE=bulk \
+#       celery -A weather_data_aggregator worker -Q bulk
+WEATHER_WORKER_PROFILES = {
+    'windows': {
+        WEATHER_INTERACTIVE_QUEUE: {'pool': 'solo', 'concurrency': 1, 'prefetch_multiplier': 1},
+        WEATHER_BULK_QUEUE: {'pool': 'solo', 'concurrency': 1, 'prefetch_multiplier': 1},
+    },
+    'production': {
+        # Many threads, no prefetch: short tasks start as soon as a slot frees up
+        WEATHER_INTERACTIVE_QUEUE: {'pool': 'threads', 'concurrency': 32, 'prefetch_multiplier': 1},
+        # Long tasks: fewer slots, and no prefetch so a worker never reserves
+        # long messages that idle bulk workers could have started
+        WEATHER_BULK_QUEUE: {'pool': 'threads', 'concurrency': 16, 'prefetch_multiplier': 1},
+    },
+}
+WEATHER_WORKER_PROFILE = env('WEATHER_WORKER_PROFILE', default='windows')
+WEATHER_WORKER_QUEUE = env('WEATHER_WORKER_QUEUE', default=WEATHER_INTERACTIVE_QUEUE)
+_worker_profile = WEATHER_WORKER_PROFILES[WEATHER_WORKER_PROFILE][WEATHER_WORKER_QUEUE]
+
+# Each value can still be overridden directly, e.g. CELERY_WORKER_POOL=gevent
+CELERY_WORKER_POOL = env('CELERY_WORKER_POOL', default=_worker_profile['pool'])
+CELERY_WORKER_CONCURRENCY = env.int(
+    'CELERY_WORKER_CONCURRENCY', default=_worker_profile['concurrency'])
+CELERY_WORKER_PREFETCH_MULTIPLIER = env.int(
+    'CELERY_WORKER_PREFETCH_MULTIPLIER', default=_worker_profile['prefetch_multiplier'])
 CELERY_TASK_ALWAYS_EAGER = False
-CELERY_TASK_SERIALIZER = 'json'
-CELERY_RESULT_SERIALIZER = 'json'
-CELERY_ACCEPT_CONTENT = ['json']
+
+# Compact messages: msgpack task/result payloads (needs the msgpack package)
+# and zlib compression for task messages whose serialized arguments reach
+# WEATHER_TASK_COMPRESSION_THRESHOLD bytes (see core.task_routes). A full
+# request (10 cities of up to 100 characters) serializes to about 1 KB, so
+# the default only skips compressing typical short city lists. The flag only
+# picks the serializer: every process accepts both JSON and msgpack, so
+# messages already queued survive rolling deploys and switching it either way.
+WEATHER_COMPACT_MESSAGES = env.bool('WEATHER_COMPACT_MESSAGES', default=False)
+WEATHER_TASK_COMPRESSION_THRESHOLD = env.int(
+    'WEATHER_TASK_COMPRESSION_THRESHOLD', default=512)
+if WEATHER_COMPACT_MESSAGES:
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        raise ImproperlyConfigured(
+            'WEATHER_COMPACT_MESSAGES requires the msgpack package')
+CELERY_TASK_SERIALIZER = 'msgpack' if WEATHER_COMPACT_MESSAGES else 'json'
+CELERY_RESULT_SERIALIZER = CELERY_TASK_SERIALIZER
+CELERY_ACCEPT_CONTENT = ['json', 'msgpack']
 CELERY_TIMEZONE = TIME_ZONE
-CELERY_RESULT_EXPIRES = 3600  # 1 hour
+CELERY_RESULT_EXPIRES = env.int('CELERY_RESULT_EXPIRES', default=3600)  # 1 hour
+
+# What get_weather stores in the result backend; outcomes are always
+# persisted on WeatherRequest/WeatherData:
+#   full     per-city entries, error bodies cut to WEATHER_TASK_RESULT_ERROR_CHARS
+#   summary  counts and final status only
+#   none     results are not stored at all
+WEATHER_TASK_RESULT_MODE = env('WEATHER_TASK_RESULT_MODE', default='full')
+WEATHER_TASK_RESULT_ERROR_CHARS = env.int('WEATHER_TASK_RESULT_ERROR_CHARS', default=200)
+CELERY_TASK_IGNORE_RESULT = WEATHER_TASK_RESULT_MODE == 'none'
+
+# Rows fetched per round trip by the streaming export cursor
+WEATHER_EXPORT_CHUNK_SIZE = 2000
+
+# Minimum seconds between database refreshes of the per-process
+# "latest conditions" snapshot
+WEATHER_LATEST_REFRESH_SECONDS = 5
+# Each refresh re-reads this many ids below the highest one seen, since
+# concurrent inserts can commit out of id order
+WEATHER_LATEST_REFRESH_OVERLAP_IDS = env.int('WEATHER_LATEST_REFRESH_OVERLAP_IDS', default=500)
+
+# Reuse an in-flight request from the same IP for the same set of cities
+# submitted within this many seconds (0 disables content-based dedup;
+# Idempotency-Key headers are always honoured)
+WEATHER_DEDUP_WINDOW_SECONDS = env.int('WEATHER_DEDUP_WINDOW_SECONDS', default=0)
+
+# Cities WeatherAPI could not resolve are remembered for this many seconds
+# and failed without an upstream call
+WEATHER_NEGATIVE_CACHE_TTL = env.int('WEATHER_NEGATIVE_CACHE_TTL', default=900)
+# Reject known-unknown cities at validation time instead of queueing them
+WEATHER_REJECT_UNKNOWN_CITIES = env.bool('WEATHER_REJECT_UNKNOWN_CITIES', default=False)
+
+# Upstream timeouts: each call is capped at WEATHER_REQUEST_TIMEOUT and the
+# whole request at WEATHER_TASK_TIME_BUDGET seconds, after which remaining
+# cities are marked timed-out
+WEATHER_REQUEST_TIMEOUT = env.float('WEATHER_REQUEST_TIMEOUT', default=10)
+WEATHER_TASK_TIME_BUDGET = env.float('WEATHER_TASK_TIME_BUDGET', default=30)
+
+# Hedged upstream requests: a call slower than this percentile of recent
+# latencies gets a duplicate request and the first response wins
+WEATHER_HEDGE_ENABLED = env.bool('WEATHER_HEDGE_ENABLED', default=True)
+WEATHER_HEDGE_PERCENTILE = env.float('WEATHER_HEDGE_PERCENTILE', default=95)
+WEATHER_HEDGE_MIN_SAMPLES = env.int('WEATHER_HEDGE_MIN_SAMPLES', default=20)
+# Maximum hedges in flight per process; stragglers beyond it are not hedged
+WEATHER_HEDGE_MAX_WORKERS = env.int('WEATHER_HEDGE_MAX_WORKERS', default=8)
+
+# Brotli level used by core.middleware.CompressionMiddleware when the optional
+# brotli package is installed (0-11; gzip is used otherwise)
+WEATHER_BROTLI_QUALITY = env.int('WEATHER_BROTLI_QUALITY', default=5)
+
+# Cities resolved through the Location gazetteer whose coordinates fall in the
+# same grid cell of this many degrees (~11 km at 0.1) share one upstream
+# fetch; 0 only merges identical names
+WEATHER_GRID_CELL_DEGREES = env.float('WEATHER_GRID_CELL_DEGREES', default=0.1)
+
+# Opt-in profiling of API views and get_weather (core.profiling): captures
+# are taken for requests with an "X-Profile: 1" header (when enabled), tasks
+# called with profile=True, and a WEATHER_PROFILE_SAMPLE_RATE fraction of calls
+WEATHER_PROFILE_DIR = env.path('WEATHER_PROFILE_DIR', default=BASE_DIR / 'profiles')
+WEATHER_PROFILE_SAMPLE_RATE = env.float('WEATHER_PROFILE_SAMPLE_RATE', default=0.0)
+WEATHER_PROFILE_HEADER_ENABLED = env.bool('WEATHER_PROFILE_HEADER_ENABLED', default=DEBUG)
 
 # API Keys
 WEATHER_API_KEY = env("WEATHER_API_KEY")
+
+# Upstream weather providers, tried in order of observed latency; a provider
+# whose error rate over the last WEATHER_PROVIDER_HEALTH_WINDOW seconds reaches
+# WEATHER_PROVIDER_MAX_ERROR_RATE is only used once the others have failed,
+# apart from one probe call per window, until a call to it succeeds again
+WEATHER_PROVIDERS = [
+    {
+        'class': 'core.providers.WeatherAPIProvider',
+        'options': {'api_key': WEATHER_API_KEY},
+    },
+]
+WEATHER_PROVIDER_HEALTH_WINDOW = env.int('WEATHER_PROVIDER_HEALTH_WINDOW', default=60)
+WEATHER_PROVIDER_MIN_SAMPLES = env.int('WEATHER_PROVIDER_MIN_SAMPLES', default=5)
+WEATHER_PROVIDER_MAX_ERROR_RATE = env.float('WEATHER_PROVIDER_MAX_ERROR_RATE', default=0.5)
@@ -1,33 +1,16 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
+from . import docs
 
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Weather API",
-        default_version="v1",
-        description="API documentation for WeatherRequest and WeatherData",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="your@email.com"),
-        license=openapi.License(name="MIT License"),
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny],
-)
-
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("core.urls")),
 
 
     re_path(r"^swagger(?P<format>\.json|\.yaml)$",
-            schema_view.without_ui(cache_timeout=0),
+            docs.schema,
             name="schema-json"),
-    path("swagger/", schema_view.with_ui("swagger",
-         cache_timeout=0), name="schema-swagger-ui"),
-    path("redoc/", schema_view.with_ui("redoc",
-         cache_timeout=0), name="schema-redoc"),
+    path("swagger/", docs.swagger_ui, name="schema-swagger-ui"),
+    path("redoc/", docs.redoc, name="schema-redoc"),
 ]